@@ -0,0 +1,268 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from monitor import DiskIO
+
+
+@dataclass
+class BroadcastResult:
+    delivered: int = 0
+    failed: int = 0
+    blocked: int = 0    # пользователь заблокировал бота
+
+    def __str__(self):
+        return f"доставлено {self.delivered}, ошибок {self.failed}, заблокировали бота {self.blocked}"
+
+
+class RateLimiter:
+    """Равномерно распределяет запросы: не больше rate запросов в секунду"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        """Flood wait: никто не отправляет, пока не истечёт пауза"""
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+class Broadcaster:
+    """Параллельная рассылка с соблюдением лимитов Telegram
+
+    Общий лимит — rate сообщений в секунду на бота, повторная отправка
+    в тот же чат — не чаще раза в per_chat_interval секунд. При flood wait
+    (retry_after) рассылка приостанавливается целиком и сообщение
+    отправляется повторно.
+    """
+
+    def __init__(self, bot, rate=25, concurrency=10, per_chat_interval=1.0, max_retries=3):
+        self.bot = bot
+        self.limiter = RateLimiter(rate)
+        self.concurrency = concurrency
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+
+    async def send(self, chat_ids, text, progress=None, **kwargs):
+        """Отправляет text всем chat_ids и возвращает BroadcastResult
+
+        progress — объект с корутинами started(chat_id) и finished(chat_id, status),
+        которые ожидаются до и после отправки каждому получателю.
+        """
+        result = BroadcastResult()
+        queue = asyncio.Queue()
+        for chat_id in chat_ids:
+            queue.put_nowait(chat_id)
+
+        async def worker():
+            while True:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if progress:
+                    await progress.started(chat_id)
+                status = await self.send_one(chat_id, text, **kwargs)
+                setattr(result, status, getattr(result, status) + 1)
+                if progress:
+                    await progress.finished(chat_id, status)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, queue.qsize()))]
+        await asyncio.gather(*workers)
+        return result
+
+    async def send_one(self, chat_id, text, **kwargs):
+        """Отправка одному получателю: 'delivered', 'failed' или 'blocked'"""
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                return 'delivered'
+            except TelegramRetryAfter as e:
+                logging.warning(f"Flood wait {e.retry_after} с при отправке {chat_id}")
+                self.limiter.pause(e.retry_after)
+                await asyncio.sleep(max(e.retry_after, self.per_chat_interval))
+            except TelegramForbiddenError:
+                return 'blocked'
+            except Exception as e:
+                logging.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                return 'failed'
+        return 'failed'
+
+
+class BroadcastJob:
+    """Рассылка, сохранённая на диске вместе с прогрессом по каждому получателю
+
+    <id>.json — текст и список получателей, <id>.progress.jsonl — журнал:
+    запись 'sending' перед отправкой и итоговый статус после неё. Получатели
+    с 'sending' без итога после сбоя считаются неизвестными и повторно не
+    получают сообщение. Файлы пишутся в потоке io.
+    """
+
+    def __init__(self, directory, spec, io):
+        self.directory = directory
+        self.spec = spec
+        self.io = io
+        self.id = spec['id']
+        self.result = BroadcastResult()
+        self.started_ids = set()
+        self.unknown = 0
+        self.task = None
+        self._on_done = []
+        self._progress = None
+
+    @property
+    def spec_path(self):
+        return os.path.join(self.directory, f"{self.id}.json")
+
+    @property
+    def progress_path(self):
+        return os.path.join(self.directory, f"{self.id}.progress.jsonl")
+
+    @property
+    def total(self):
+        return len(self.spec['recipients'])
+
+    @property
+    def done(self):
+        return self.spec['status'] == 'done'
+
+    def save_spec(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.spec_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.spec, f, ensure_ascii=False)
+        os.replace(tmp_path, self.spec_path)
+
+    def load_progress(self):
+        if not os.path.exists(self.progress_path):
+            return
+        finished = set()
+        with open(self.progress_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Оборванная при сбое запись
+                self.started_ids.add(record['chat_id'])
+                if record['status'] != 'sending':
+                    finished.add(record['chat_id'])
+                    setattr(self.result, record['status'], getattr(self.result, record['status']) + 1)
+        self.unknown = len(self.started_ids - finished)
+
+    def remaining(self):
+        return [chat_id for chat_id in self.spec['recipients'] if chat_id not in self.started_ids]
+
+    async def started(self, chat_id):
+        self.started_ids.add(chat_id)
+        await self.io.run('прогресс рассылки', self._write_progress, chat_id, 'sending')
+
+    async def finished(self, chat_id, status):
+        setattr(self.result, status, getattr(self.result, status) + 1)
+        await self.io.run('прогресс рассылки', self._write_progress, chat_id, status)
+
+    def _write_progress(self, chat_id, status):
+        if self._progress is None:
+            self._progress = open(self.progress_path, 'a', encoding='utf-8')
+        self._progress.write(json.dumps({'chat_id': chat_id, 'status': status}) + '\n')
+        self._progress.flush()
+
+    def _close_progress(self):
+        if self._progress is not None:
+            self._progress.close()
+            self._progress = None
+
+    def add_done_callback(self, callback):
+        """callback(job) — корутина, вызывается по окончании рассылки"""
+        self._on_done.append(callback)
+
+    async def run(self, broadcaster):
+        # Новая рассылка сохраняется до первой отправки
+        await self.io.run('файл рассылки', self.save_spec)
+        try:
+            await broadcaster.send(self.remaining(), self.spec['text'], progress=self)
+        finally:
+            await self.io.run('прогресс рассылки', self._close_progress)
+        self.spec['status'] = 'done'
+        await self.io.run('файл рассылки', self.save_spec)
+        for callback in self._on_done:
+            try:
+                await callback(self)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика завершения рассылки #{self.id}: {e}")
+
+    def describe(self):
+        processed = self.result.delivered + self.result.failed + self.result.blocked + self.unknown
+        status = "✅ завершена" if self.done else "⏳ идёт"
+        text = f"#{self.id} от {self.spec['created_at']} — {status}, {processed}/{self.total}: {self.result}"
+        if self.unknown:
+            text += f", неизвестно {self.unknown}"
+        return text
+
+
+class BroadcastQueue:
+    """Рассылки в фоне, переживающие перезапуск бота"""
+
+    def __init__(self, broadcaster, directory, io=None):
+        self.broadcaster = broadcaster
+        self.directory = directory
+        self.io = io or DiskIO('broadcast-io')
+        self.jobs = {}              # id -> BroadcastJob
+        self.on_done = None         # корутина(job), вызывается для каждой завершённой рассылки
+
+    def _start(self, job):
+        if self.on_done:
+            job.add_done_callback(self.on_done)
+        job.task = asyncio.create_task(job.run(self.broadcaster))
+
+    def submit(self, chat_ids, text):
+        """Запускает рассылку в фоне; она сохраняется на диск до первой отправки"""
+        job_id = max(self.jobs, default=0) + 1
+        job = BroadcastJob(self.directory, {
+            'id': job_id,
+            'text': text,
+            'recipients': list(chat_ids),
+            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'status': 'running',
+        }, self.io)
+        self.jobs[job_id] = job
+        self._start(job)
+        return job
+
+    def resume(self):
+        """Загружает рассылки с диска и продолжает незавершённые"""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                job = BroadcastJob(self.directory, json.load(f), self.io)
+            job.load_progress()
+            self.jobs[job.id] = job
+            if not job.done:
+                logging.info(f"Продолжаем рассылку #{job.id}: осталось {len(job.remaining())}")
+                self._start(job)
+
+    def recent(self, limit=10):
+        return [self.jobs[job_id] for job_id in sorted(self.jobs, reverse=True)[:limit]]
+
+    async def close(self):
+        """Останавливает идущие рассылки: после перезапуска они продолжатся"""
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,56 @@
+"""Кодирование JSON для хранилищ: orjson, если установлен, иначе стандартный json
+
+Оба кодека дают одинаковый результат на диске, поэтому переключаться между
+ними можно без миграции. Ошибки разбора — json.JSONDecodeError (orjson
+бросает его подкласс).
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    # Множества (реакции) хранятся на диске отсортированными массивами
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    # Записи базы (records.py) — в прежнем виде словарей
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class StdlibCodec:
+    name = 'json'
+
+    def dumps(self, value, indent=False):
+        if indent:
+            return json.dumps(value, ensure_ascii=False, indent=2, default=_default)
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def loads(self, text):
+        return json.loads(text)
+
+
+class OrjsonCodec:
+    name = 'orjson'
+
+    def dumps(self, value, indent=False):
+        # Ключи-числа (id постов в реакциях) записываются строками, как в json
+        # Записи-dataclass кодируются через to_dict(), а не по полям
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(value, default=_default, option=option).decode('utf-8')
+
+    def loads(self, text):
+        return orjson.loads(text)
+
+
+def get_codec(name='auto'):
+    """Кодек по имени: 'json', 'orjson' или 'auto' — самый быстрый из доступных"""
+    if name == 'json' or (name == 'auto' and orjson is None):
+        return StdlibCodec()
+    if orjson is None:
+        raise RuntimeError("Кодек orjson не установлен: pip install orjson")
+    return OrjsonCodec()
@@ -0,0 +1,41 @@
+from collections import defaultdict, deque
+
+PREVIEW_SIZE = 3    # последние комментарии в карточке поста
+
+
+class CommentStore:
+    """Комментарии, сгруппированные по номеру поста
+
+    Все комментарии лежат в db['comments'] в порядке добавления; хранилище
+    ссылается на те же записи, поэтому число комментариев поста и нужная
+    страница берутся без перебора чужих. Последние PREVIEW_SIZE комментариев
+    каждого поста обновляются при добавлении и читаются карточкой поста готовыми.
+    """
+
+    def __init__(self):
+        self.by_post = defaultdict(list)    # post_id -> [комментарий] по порядку
+        self.previews = {}                  # post_id -> deque последних комментариев
+
+    def rebuild(self, comments):
+        self.__init__()
+        for comment in comments:
+            self.add(comment)
+
+    def add(self, comment):
+        self.by_post[comment.post_id].append(comment)
+        preview = self.previews.get(comment.post_id)
+        if preview is None:
+            preview = self.previews[comment.post_id] = deque(maxlen=PREVIEW_SIZE)
+        preview.append(comment)
+
+    def count(self, post_id):
+        comments = self.by_post.get(post_id)
+        return len(comments) if comments else 0
+
+    def page(self, post_id, offset, size):
+        """Комментарии поста с offset по offset + size (старые первыми)"""
+        return self.by_post.get(post_id, [])[offset:offset + size]
+
+    def latest(self, post_id):
+        """Последние PREVIEW_SIZE комментариев поста"""
+        return tuple(self.previews.get(post_id, ()))
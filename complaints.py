@@ -0,0 +1,93 @@
+from collections import Counter, defaultdict
+
+# Статусы жалобы: новая -> решена (пользователь наказан) или отклонена
+STATUSES = {
+    'new': '🆕 новая',
+    'resolved': '✅ решена',
+    'rejected': '🚫 отклонена',
+}
+
+
+class ComplaintIndex:
+    """Жалобы в памяти с индексами по нарушителю, автору и статусу
+
+    Номер жалобы — её позиция в списке (с 1), как у постов. Индексы хранят
+    номера в порядке поступления, поэтому свежие жалобы читаются с конца.
+    Счётчики жалоб на пользователя обновляются при каждом изменении.
+    """
+
+    def __init__(self, complaints=()):
+        self.items = []
+        self.by_target = defaultdict(list)          # target_id -> [номер]
+        self.by_complainant = defaultdict(list)     # complainant_id -> [номер]
+        self.by_status = {status: {} for status in STATUSES}  # статус -> {номер: None} (по порядку)
+        self.counts = Counter()                     # target_id -> всего жалоб
+        self.open_counts = Counter()                # target_id -> новых жалоб
+        for complaint in complaints:
+            self.add(complaint)
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, complaint_id):
+        if 1 <= complaint_id <= len(self.items):
+            return self.items[complaint_id - 1]
+        return None
+
+    def add(self, complaint):
+        """Добавляет жалобу; повторное добавление того же номера (из журнала) пропускается"""
+        complaint_id = complaint.setdefault('id', len(self.items) + 1)
+        if complaint_id <= len(self.items):
+            return self.items[complaint_id - 1]
+        self.items.append(complaint)
+        self.by_target[complaint['target_id']].append(complaint_id)
+        self.by_complainant[complaint['complainant_id']].append(complaint_id)
+        self.by_status[complaint['status']][complaint_id] = None
+        self.counts[complaint['target_id']] += 1
+        if complaint['status'] == 'new':
+            self.open_counts[complaint['target_id']] += 1
+        return complaint
+
+    def set_status(self, complaint_id, status):
+        complaint = self.get(complaint_id)
+        if complaint is None or complaint['status'] == status:
+            return
+        if complaint['status'] == 'new':
+            self.open_counts[complaint['target_id']] -= 1
+            if not self.open_counts[complaint['target_id']]:
+                del self.open_counts[complaint['target_id']]
+        elif status == 'new':
+            self.open_counts[complaint['target_id']] += 1
+        del self.by_status[complaint['status']][complaint_id]
+        self.by_status[status][complaint_id] = None
+        complaint['status'] = status
+
+    def open_against(self, target_id):
+        """Номера новых жалоб на пользователя"""
+        return [complaint_id for complaint_id in self.by_target.get(target_id, ())
+                if self.items[complaint_id - 1]['status'] == 'new']
+
+    def query(self, status=None, target_id=None, complainant_id=None):
+        """Номера жалоб по фильтрам, свежие первыми"""
+        if target_id is not None:
+            ids = self.by_target.get(target_id, [])
+        elif complainant_id is not None:
+            ids = self.by_complainant.get(complainant_id, [])
+        elif status is not None:
+            ids = list(self.by_status[status])
+        else:
+            ids = range(1, len(self.items) + 1)
+
+        result = []
+        for complaint_id in reversed(ids):
+            complaint = self.items[complaint_id - 1]
+            if status is not None and complaint['status'] != status:
+                continue
+            if complainant_id is not None and complaint['complainant_id'] != complainant_id:
+                continue
+            result.append(complaint_id)
+        return result
+
+    def repeat_offenders(self, k=10):
+        """Пользователи с наибольшим числом новых жалоб: [(target_id, количество)]"""
+        return self.open_counts.most_common(k)
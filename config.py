@@ -3,3 +3,37 @@ API_TOKEN = '7212471955:AAGDrPy0bTq_4nEPCeDLaNf6IqFW66gsveM'
 ADMIN_ID = 2018774297
 DB_FILE = 'users_db.json'
 COMPLAINTS_FILE = 'complaints.json'
+SAVE_INTERVAL = 1.0  # как часто (в секундах) изменения базы сбрасываются на диск
+REACTION_FLUSH_INTERVAL = 0.5  # как часто (в секундах) накопленные лайки и дизлайки пишутся в журнал
+JOURNAL_FILE = 'users_db.journal.jsonl'  # журнал изменений постов, реакций и комментариев
+JOURNAL_COMPACT_EVERY = 500  # после скольких записей журнал сжимается в снимок
+DB_COMPACT_JSON = False  # True — снимок базы без отступов (меньше и быстрее пишется)
+JSON_CODEC = 'auto'  # 'orjson', 'json' или 'auto' — orjson, если установлен
+STORAGE_BACKEND = 'json'  # 'json' (users_db.json + журнал) или 'sqlite'
+SQLITE_FILE = 'school.sqlite3'  # файл базы для STORAGE_BACKEND = 'sqlite' (см. migrate.py)
+TELEGRAM_API_URL = None  # адрес своего сервера Bot API, None — api.telegram.org
+BROADCAST_RATE = 25  # сообщений в секунду при рассылке (лимит Telegram — около 30)
+BROADCAST_CONCURRENCY = 10  # одновременных запросов при рассылке
+BROADCAST_JOBS_DIR = 'broadcasts'  # задания рассылок и их прогресс (для продолжения после перезапуска)
+FSM_FILE = 'fsm.sqlite3'  # незавершённые диалоги (регистрация, посты, комментарии)
+FSM_TTL = 24 * 3600  # через сколько секунд без активности диалог сбрасывается
+FSM_FLUSH_INTERVAL = 2.0  # как часто (в секундах) состояния диалогов пишутся на диск
+RUN_MODE = 'polling'  # 'polling' или 'webhook'
+WEBHOOK_HOST = '0.0.0.0'  # адрес и порт сервера вебхука
+WEBHOOK_PORT = 8080
+WEBHOOK_PATH = '/webhook'
+WEBHOOK_SECRET = None  # секрет, который Telegram передаёт в X-Telegram-Bot-Api-Secret-Token (обязателен для 'webhook')
+WEBHOOK_URL = None  # внешний адрес сервера (https://...); если задан, вебхук регистрируется при старте
+THROTTLE_LIMITS = {  # команда -> (сколько запросов, за сколько секунд); 'default' — всё остальное
+    'like': (10, 60),
+    'dislike': (10, 60),
+    'posts': (20, 60),
+    'top': (10, 60),
+    'search': (10, 60),
+    'complain': (3, 600),
+    'support': (3, 600),
+    'default': (30, 60),
+}
+THROTTLE_CLEANUP_INTERVAL = 300  # как часто (в секундах) забываются счётчики неактивных пользователей
+RENDER_CACHE_SIZE = 512  # сколько готовых ответов (/post, /top, /posts, /users) хранится в памяти
+MARKUP_EDIT_INTERVAL = 1.0  # не чаще раза в столько секунд обновляются счётчики на кнопках одного сообщения
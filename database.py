@@ -0,0 +1,533 @@
+import asyncio
+import copy
+import heapq
+import logging
+import random
+import string
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from comments import CommentStore
+from complaints import ComplaintIndex
+from monitor import DiskIO
+from ranking import Ranking, RANKING_PERIODS
+from records import Comment, Post, User
+from schemas import COMPLAINT
+from search import SearchIndex
+
+
+
+# Операция -> данные, которые она меняет (их версии сбрасывают кэш ответов);
+# 'post' — сам пост из поля post_id операции
+OP_EVENTS = {
+    'post_add': ('posts',),
+    'reaction': ('posts', 'post'),
+    'comment_add': ('posts', 'post'),
+    'user_approve': ('users',),
+    'user_update': ('users',),
+}
+
+# Реакция -> счётчик в посте и раздел db['reactions'] (post_id -> множество user_id)
+REACTION_FIELDS = {
+    'like': 'likes',
+    'dislike': 'dislikes',
+}
+
+
+class UserRegistry:
+    """Индексы пользователей по user_id, account_code и username
+
+    Словари ссылаются на те же записи, что и списки db['approved']/db['pending'],
+    поэтому изменения полей (например, бан) сразу видны через индексы.
+    """
+
+    def __init__(self):
+        self.approved = {}              # user_id -> пользователь
+        self.pending = {}               # user_id -> заявка
+        self.codes = {}                 # account_code -> пользователь
+        self.usernames = {}             # username -> пользователь
+        self.reserved_codes = set()     # все выданные коды, включая заявки
+
+    def rebuild(self, db):
+        self.__init__()
+        for user in db['pending']:
+            self.add_pending(user)
+        for user in db['approved']:
+            self._index_approved(user)
+
+    def _index_approved(self, user):
+        self.approved[user['user_id']] = user
+        self.codes.setdefault(user['account_code'], user)
+        self.usernames.setdefault(user['username'], user)
+        self.reserved_codes.add(user['account_code'])
+
+    def _unindex_approved(self, user):
+        if self.codes.get(user['account_code']) is user:
+            del self.codes[user['account_code']]
+        if self.usernames.get(user['username']) is user:
+            del self.usernames[user['username']]
+
+    def get(self, user_id):
+        """Одобренный пользователь по Telegram ID"""
+        return self.approved.get(user_id)
+
+    def by_code(self, code):
+        return self.codes.get(code)
+
+    def find(self, target):
+        """Поиск по коду аккаунта или username"""
+        return self.codes.get(target) or self.usernames.get(target)
+
+    def get_pending(self, user_id):
+        return self.pending.get(user_id)
+
+    def is_registered(self, user_id):
+        """Одобрен или ожидает одобрения"""
+        return user_id in self.approved or user_id in self.pending
+
+    def add_pending(self, user):
+        self.pending[user['user_id']] = user
+        self.reserved_codes.add(user['account_code'])
+
+    def approve(self, user_id):
+        user = self.pending.pop(user_id)
+        self._index_approved(user)
+        return user
+
+    def reject(self, user_id):
+        user = self.pending.pop(user_id)
+        self.reserved_codes.discard(user['account_code'])
+        return user
+
+    def update(self, user, fields):
+        self._unindex_approved(user)
+        user.update(fields)
+        self._index_approved(user)
+
+    def generate_code(self):
+        """Новый шестизначный код, не совпадающий ни с одним выданным"""
+        while True:
+            code = ''.join(random.choices(string.digits, k=6))
+            if code not in self.reserved_codes:
+                self.reserved_codes.add(code)
+                return code
+
+
+class BanTable:
+    """Действующие баны: user_id -> время окончания (секунды Unix)
+
+    Проверка бана — поиск в словаре и сравнение чисел. Куча сроков
+    окончания позволяет снимать баны ровно в срок, не перебирая всех.
+    """
+
+    def __init__(self):
+        self.expiry = {}                # user_id -> время окончания бана
+        self._heap = []                 # (время окончания, user_id); устаревшие пары пропускаются
+        self._changed = asyncio.Event()
+
+    def rebuild(self, users):
+        self.expiry.clear()
+        self._heap.clear()
+        for user in users:
+            self.set(user['user_id'], user['banned_until'])
+
+    def set(self, user_id, banned_until):
+        """banned_until — datetime окончания бана или None (бан снят)"""
+        if banned_until is None:
+            self.expiry.pop(user_id, None)
+            return
+        expiry = int(banned_until.timestamp())
+        self.expiry[user_id] = expiry
+        heapq.heappush(self._heap, (expiry, user_id))
+        self._changed.set()
+
+    def is_banned(self, user_id):
+        expiry = self.expiry.get(user_id)
+        return expiry is not None and time.time() < expiry
+
+    def expired(self, user_id):
+        """Бан есть в таблице, но его срок уже истёк"""
+        expiry = self.expiry.get(user_id)
+        return expiry is not None and time.time() >= expiry
+
+    async def run(self, on_expire):
+        """Фоновая задача: вызывает on_expire(user_id), когда срок бана истекает"""
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                expiry, user_id = heapq.heappop(self._heap)
+                if self.expiry.get(user_id) != expiry:
+                    continue  # бан продлён или снят раньше срока
+                try:
+                    await on_expire(user_id)
+                except Exception as e:
+                    logging.error(f"Ошибка снятия бана пользователя {user_id}: {e}")
+
+            self._changed.clear()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class Database:
+    """База данных в памяти: читается из хранилища один раз, изменения сохраняются в фоне
+
+    Каждое изменение — операция (метод _op_*): она применяется к базе в памяти
+    одинаково при работе бота и при восстановлении из журнала, а затем
+    передаётся хранилищу (журнал JSON или таблицы SQLite).
+
+    Изменять базу можно только внутри ``async with database.transaction()``:
+    транзакции выполняются строго по очереди, а чтение не блокируется.
+
+    Запись на диск идёт в отдельном потоке (по одному, в порядке поступления),
+    чтобы не останавливать event loop; операции нескольких транзакций,
+    пришедших, пока идёт запись, объединяются в одну запись с одним fsync.
+
+    Реакции (react) применяются сразу, без транзакции, и копятся в буфере:
+    раз в reaction_interval секунд буфер пишется одной транзакцией.
+    """
+
+    def __init__(self, storage, factory, upgrade=None, save_interval=1.0, reaction_interval=0.5):
+        self.storage = storage
+        self.factory = factory          # создаёт пустую базу (init_db)
+        self.upgrade = upgrade          # дополняет старые записи недостающими полями
+        self.save_interval = save_interval
+        self.reaction_interval = reaction_interval
+        self.data = None
+        self.dirty = False
+        self.seq = 0                    # номер последней операции
+        self.users = UserRegistry()
+        self.bans = BanTable()
+        self.comments = CommentStore()
+        self.complaints = ComplaintIndex()
+        self.search = SearchIndex()
+        self.rankings = {}              # период ('day', 'week', 'all') -> Ranking
+        self.versions = Counter()       # 'posts', 'users', ('post', id) -> номер изменения
+        self._write_lock = asyncio.Lock()
+        self._batch = None              # операции текущей транзакции
+        self._io = DiskIO('db-io')
+        self._pending = []              # операции, ожидающие записи
+        self._waiters = []              # транзакции, ожидающие записи своих операций
+        self._writer = None             # задача, записывающая _pending
+        self._reactions = {}            # (post_id, user_id) -> реакция, ещё не переданная хранилищу
+        self.timings = self._io.timings
+
+    def load(self):
+        """Загружает базу и применяет к ней журнал (однократно при старте)"""
+        self.data = self.storage.load()
+        created = self.data is None
+        if created:
+            self.data = self.factory()
+
+        if self.upgrade:
+            self.upgrade(self.data)
+
+        self._hydrate()
+        self._thaw_reactions()
+        self.users.rebuild(self.data)
+        self.bans.rebuild(self.data['approved'])
+        self.comments.rebuild(self.data['comments'])
+        self._build_rankings()
+        self._load_search()
+        self.complaints = ComplaintIndex(COMPLAINT.decode(complaint) for complaint in self.storage.load_complaints())
+        self.seq = self.data.get('journal_seq', 0)
+        replayed = 0
+        for record in self.storage.replay(self.seq):
+            record = dict(record)
+            op = record.pop('op')
+            self.seq = record.pop('seq')
+            getattr(self, f"_op_{op}")(**record)
+            replayed += 1
+        if replayed:
+            logging.info(f"Восстановлено {replayed} записей из журнала")
+
+        if created or replayed:
+            self.flush(force=True)
+        return self.data
+
+    def _hydrate(self):
+        """Словари из хранилища -> записи User/Post/Comment"""
+        for section in ('pending', 'approved'):
+            self.data[section] = [User.from_dict(user) for user in self.data[section]]
+        authors = {user.user_id: user for user in self.data['pending'] + self.data['approved']}
+        comments = self.data.setdefault('comments', [])
+        for post in self.data['posts']:
+            # Раньше комментарии хранились внутри постов
+            comments.extend({**comment, 'post_id': post['id']} for comment in post.pop('comments', ()))
+        self.data['posts'] = [Post.from_dict(post, authors.get) for post in self.data['posts']]
+        self.data['comments'] = [Comment.from_dict(comment, authors.get) for comment in comments]
+
+    def _author(self, user_id):
+        return self.users.get(user_id) or self.users.get_pending(user_id)
+
+    def _thaw_reactions(self):
+        """На диске реакции — отсортированные массивы с ключами-строками, в памяти — множества"""
+        reactions = self.data.setdefault('reactions', {})
+        for section in REACTION_FIELDS.values():
+            reactions[section] = {
+                int(post_id): set(voters)
+                for post_id, voters in reactions.get(section, {}).items()
+            }
+
+    def _build_rankings(self):
+        self.rankings = {period: Ranking(window) for period, window in RANKING_PERIODS.items()}
+        for post in self.data['posts']:
+            self._rank_post(post)
+
+    def _rank_post(self, post):
+        score = post.likes - post.dislikes
+        for ranking in self.rankings.values():
+            ranking.add(post.id, score, post.created_at)
+
+    def _load_search(self):
+        # Индекс сохраняется в снимке как db['search'] (SearchIndex.to_dict)
+        self.search = SearchIndex.from_dict(self.data.get('search'))
+        self.search.catch_up(self.data['posts'], self.data['comments'])
+        self.data['search'] = self.search
+
+    def search_posts(self, query):
+        """Посты по запросу, самые подходящие первыми: список (пост, оценка)"""
+        posts = self.get()['posts']
+        return [(posts[post_id - 1], score) for post_id, score in self.search.search(query)]
+
+    def ranking_version(self, period):
+        """Меняется при реакциях, новых постах и выходе постов за окно периода"""
+        ranking = self.rankings[period]
+        ranking.expire()
+        return ranking.version
+
+    def top_posts(self, k, period='all'):
+        """Лучшие k постов за период: список (пост, рейтинг)"""
+        posts = self.get()['posts']
+        return [(posts[post_id - 1], score) for post_id, score in self.rankings[period].top(k)]
+
+    def posts_count(self):
+        return len(self.get()['posts'])
+
+    def posts_page(self, top_id, size):
+        """Посты с номерами top_id, top_id - 1, ... (не больше size)"""
+        posts = self.get()['posts']
+        return posts[max(0, top_id - size):top_id][::-1]
+
+    def get(self):
+        """Возвращает базу из памяти"""
+        if self.data is None:
+            self.load()
+        return self.data
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Единственный писатель: проверки и операции внутри блока не пересекаются
+        с другими транзакциями. Операции блока передаются хранилищу вместе при выходе.
+        """
+        written = None
+        async with self._write_lock:
+            self._batch = []
+            try:
+                yield self.get()
+            finally:
+                batch, self._batch = self._batch, None
+                if batch:
+                    written = self._enqueue(batch)
+        # Следующая транзакция может начаться, пока эта записывается на диск
+        if written:
+            await written
+
+    def _enqueue(self, batch):
+        # Копия: объекты в памяти продолжат меняться, пока поток пишет на диск
+        self._pending.extend(copy.deepcopy(batch))
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+        return waiter
+
+    async def _write_pending(self):
+        while self._pending:
+            records, self._pending = self._pending, []
+            waiters, self._waiters = self._waiters, []
+            try:
+                await self._io.run('запись журнала', self.storage.append, records)
+            except Exception as e:
+                # Операции уже в памяти — они попадут в ближайший снимок
+                logging.error(f"Ошибка записи журнала: {e}")
+                self.mark_dirty()
+            if self.storage.needs_snapshot():
+                self.mark_dirty()
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    def apply(self, op, **fields):
+        """Применяет операцию к базе в памяти (только внутри transaction())"""
+        if self._batch is None:
+            raise RuntimeError("database.apply() вызван вне database.transaction()")
+        getattr(self, f"_op_{op}")(**fields)
+        self._changed(op, fields)
+        self._log(op, fields)
+
+    def _changed(self, op, fields):
+        for event in OP_EVENTS.get(op, ()):
+            self.versions[('post', fields['post_id']) if event == 'post' else event] += 1
+
+    def _log(self, op, fields):
+        self.seq += 1
+        self._batch.append({'seq': self.seq, 'op': op, **fields})
+
+    def _op_post_add(self, post):
+        # Номер поста выдаётся здесь, под блокировкой писателя
+        post.setdefault('id', len(self.data['posts']) + 1)
+        record = Post.from_dict(post, self._author)
+        self.data['posts'].append(record)
+        self._rank_post(record)
+        self.search.add_post(record)
+
+    def reaction(self, post_id, user_id):
+        """Реакция пользователя на пост: 'like', 'dislike' или None"""
+        reactions = self.get()['reactions']
+        for kind, section in REACTION_FIELDS.items():
+            if user_id in reactions[section].get(post_id, ()):
+                return kind
+        return None
+
+    def react(self, post_id, user_id, kind):
+        """Ставит реакцию сразу в памяти, запись на диск — с буфером (flush_reactions)
+
+        Возвращает False, если пользователь уже поставил такую реакцию. Для пары
+        (пост, пользователь) в буфере хранится только последняя реакция.
+        """
+        if self.reaction(post_id, user_id) == kind:
+            return False
+        fields = {'post_id': post_id, 'user_id': user_id, 'kind': kind}
+        self._op_reaction(**fields)
+        self._changed('reaction', fields)
+        self._reactions[(post_id, user_id)] = kind
+        return True
+
+    async def flush_reactions(self):
+        """Передаёт накопленные реакции хранилищу одной транзакцией"""
+        if not self._reactions:
+            return
+        async with self.transaction():
+            reactions, self._reactions = self._reactions, {}
+            # Реакции уже в памяти; повторное применение при восстановлении ничего не меняет
+            for (post_id, user_id), kind in reactions.items():
+                self._log('reaction', {'post_id': post_id, 'user_id': user_id, 'kind': kind})
+
+    async def run_reaction_flusher(self):
+        """Фоновая задача: периодически записывает буфер реакций"""
+        while True:
+            await asyncio.sleep(self.reaction_interval)
+            try:
+                await self.flush_reactions()
+            except Exception as e:
+                logging.error(f"Ошибка записи реакций: {e}")
+
+    def _op_reaction(self, post_id, user_id, kind):
+        post = self.data['posts'][post_id - 1]
+        reactions = self.data['reactions']
+        for other, section in REACTION_FIELDS.items():
+            voters = reactions[section].get(post_id)
+            if other != kind and voters and user_id in voters:
+                post[section] -= 1
+                voters.discard(user_id)
+                if not voters:
+                    del reactions[section][post_id]
+
+        section = REACTION_FIELDS[kind]
+        voters = reactions[section].setdefault(post_id, set())
+        if user_id not in voters:
+            post[section] += 1
+            voters.add(user_id)
+
+        score = post.likes - post.dislikes
+        for ranking in self.rankings.values():
+            ranking.update(post_id, score)
+
+    def _op_comment_add(self, post_id, comment):
+        record = Comment.from_dict({**comment, 'post_id': post_id}, self._author)
+        self.data['comments'].append(record)
+        self.comments.add(record)
+        self.search.add_comment(record)
+
+    def _op_user_register(self, user):
+        user = User.from_dict(user)
+        self.data['pending'].append(user)
+        self.users.add_pending(user)
+
+    def _op_user_approve(self, user_id):
+        if self.users.get_pending(user_id):
+            user = self.users.approve(user_id)
+            self.data['pending'].remove(user)
+            self.data['approved'].append(user)
+
+    def _op_user_reject(self, user_id):
+        if self.users.get_pending(user_id):
+            self.data['pending'].remove(self.users.reject(user_id))
+
+    def _op_user_update(self, user_id, fields):
+        user = self.users.get(user_id)
+        if user:
+            self.users.update(user, fields)
+            if 'banned_until' in fields:
+                self.bans.set(user_id, user['banned_until'])
+
+    def _op_complaint_add(self, complaint):
+        # Номер жалобы выдаётся здесь и попадает в журнал вместе с ней
+        self.complaints.add(complaint)
+
+    def _op_complaint_status(self, complaint_ids, status):
+        for complaint_id in complaint_ids:
+            self.complaints.set_status(complaint_id, status)
+
+    def mark_dirty(self):
+        """Помечает базу изменённой — снимок будет записан фоновой задачей"""
+        self.dirty = True
+
+    def flush(self, force=False):
+        """Записывает полный снимок базы синхронно (при старте, до запуска бота)"""
+        if self.data is None or not (self.dirty or force):
+            return
+        self.dirty = False
+        self.data['journal_seq'] = self.seq
+        self.storage.save(self.data, self.complaints.items)
+
+    async def flush_async(self):
+        """Записывает снимок базы в фоновом потоке
+
+        Снимок кодируется в event loop (это единственный момент, когда база
+        гарантированно не меняется) и сразу ставится в очередь потока записи —
+        раньше любых операций, появившихся после него.
+        """
+        if self.data is None or not self.dirty:
+            return
+        self.dirty = False
+        self.data['journal_seq'] = self.seq
+        start = time.monotonic()
+        snapshot = self.storage.encode_snapshot(self.data, self.complaints.items)
+        self.timings.add('кодирование снимка (в event loop)', time.monotonic() - start)
+        try:
+            await self._io.run('запись снимка', self.storage.write_snapshot, snapshot)
+        except OSError:
+            self.dirty = True
+            raise
+
+    async def run_saver(self):
+        """Фоновая задача: периодически сохраняет снимок, если он нужен"""
+        while True:
+            await asyncio.sleep(self.save_interval)
+            try:
+                await self.flush_async()
+            except OSError as e:
+                logging.error(f"Ошибка сохранения базы: {e}")
+
+    async def close(self):
+        """Дожидается записи всех операций, сохраняет снимок и закрывает хранилище"""
+        await self.flush_reactions()
+        if self._writer is not None:
+            await self._writer
+        await self.flush_async()
+        await self._io.run('закрытие хранилища', self.storage.close)
+        self._io.shutdown()
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, Mapping, Optional
+from codec import get_codec
+from monitor import DiskIO
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+
+class SqliteFSMStorage(BaseStorage):
+    """Хранилище состояний FSM в SQLite, переживающее перезапуск бота
+
+    Состояния читаются из памяти, изменения копятся и записываются на диск
+    одной транзакцией раз в flush_interval секунд в потоке io. Диалоги, которые
+    не менялись дольше ttl секунд, удаляются.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, flush_interval=2.0, codec=None, io=None):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.codec = codec or get_codec()
+        self.io = io or DiskIO('fsm-io')
+        # После загрузки соединение используется только из потока io
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.records = {}               # ключ -> [состояние, данные, время изменения]
+        self.dirty = set()
+        self._closed = False
+
+        cutoff = time.time() - ttl
+        with self.conn:
+            self.conn.execute("DELETE FROM fsm WHERE updated_at < ?", (cutoff,))
+        for key, state, data, updated_at in self.conn.execute("SELECT key, state, data, updated_at FROM fsm"):
+            self.records[key] = [state, self.codec.loads(data), updated_at]
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ':'.join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+        ))
+
+    def _record(self, key: StorageKey):
+        record = self.records.get(self._key(key))
+        if record and record[2] < time.time() - self.ttl:
+            return None
+        return record
+
+    def _update(self, key: StorageKey, index, value):
+        name = self._key(key)
+        record = self.records.setdefault(name, [None, {}, 0])
+        record[index] = value
+        record[2] = time.time()
+        self.dirty.add(name)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._update(key, 0, state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._record(key)
+        return record[0] if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._update(key, 1, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._record(key)
+        return dict(record[1]) if record else {}
+
+    def expire(self):
+        """Удаляет из памяти диалоги старше ttl"""
+        cutoff = time.time() - self.ttl
+        for name in [name for name, record in self.records.items() if record[2] < cutoff]:
+            del self.records[name]
+            self.dirty.add(name)
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией"""
+        if not self.dirty:
+            return
+        upserts, deletes = [], []
+        for name in self.dirty:
+            record = self.records.get(name)
+            if record is None or (record[0] is None and not record[1]):
+                # Завершённый или устаревший диалог хранить незачем
+                self.records.pop(name, None)
+                deletes.append((name,))
+            else:
+                upserts.append((name, record[0], self.codec.dumps(record[1]), record[2]))
+        names, self.dirty = self.dirty, set()
+
+        try:
+            await self.io.run('запись состояний FSM', self._write, upserts, deletes)
+        except sqlite3.Error:
+            self.dirty |= names
+            raise
+
+    def _write(self, upserts, deletes):
+        with self.conn:
+            self.conn.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?)", upserts
+            )
+
+    async def run_flusher(self):
+        """Фоновая задача: сбрасывает изменения на диск и чистит устаревшие диалоги"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.expire()
+                await self.flush()
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка сохранения состояний FSM: {e}")
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        await self.flush()
+        await self.io.run('закрытие состояний FSM', self.conn.close)
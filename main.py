@@ -1,26 +1,51 @@
+import asyncio
 import logging
-import json
-import os
-import random
-import string
-from config import API_TOKEN, ADMIN_ID, DB_FILE, COMPLAINTS_FILE
+from config import (API_TOKEN, ADMIN_ID, DB_FILE, COMPLAINTS_FILE, SAVE_INTERVAL, REACTION_FLUSH_INTERVAL,
+                    JOURNAL_FILE, JOURNAL_COMPACT_EVERY, DB_COMPACT_JSON, JSON_CODEC, STORAGE_BACKEND, SQLITE_FILE,
+                    TELEGRAM_API_URL, BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_JOBS_DIR,
+                    FSM_FILE, FSM_TTL, FSM_FLUSH_INTERVAL, RUN_MODE, WEBHOOK_HOST, WEBHOOK_PORT,
+                    WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL, THROTTLE_LIMITS, THROTTLE_CLEANUP_INTERVAL,
+                    RENDER_CACHE_SIZE, MARKUP_EDIT_INTERVAL)
+from broadcast import Broadcaster, BroadcastQueue
+from codec import get_codec
+from complaints import STATUSES as COMPLAINT_STATUSES
+from database import Database
+from fsm_storage import SqliteFSMStorage
+from middlewares import AccessMiddleware, ThrottlingMiddleware, UserMiddleware
+from markup_updates import MarkupUpdater
+from monitor import DiskIO, LoopMonitor
+from render_cache import RenderCache
+from schemas import USER, POST, COMMENT, COMPLAINT, upgrade_db
+from storage import JsonStorage, SqliteStorage
+from webhook import run_webhook
 from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
 from aiogram import F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.dispatcher.router import Router
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 
 # Инициализация бота
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
+if TELEGRAM_API_URL:
+    # Свой сервер Bot API (например, локальный фейковый для проверки рассылок)
+    bot = Bot(token=API_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(token=API_TOKEN)
+broadcaster = Broadcaster(bot, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY)
+# Поток записи состояний FSM и файлов рассылок (у базы — свой)
+disk_io = DiskIO()
+broadcast_queue = BroadcastQueue(broadcaster, BROADCAST_JOBS_DIR, io=disk_io)
+codec = get_codec(JSON_CODEC)
+storage = SqliteFSMStorage(FSM_FILE, ttl=FSM_TTL, flush_interval=FSM_FLUSH_INTERVAL, codec=codec, io=disk_io)
 dp = Dispatcher(storage=storage)
 router = Router()
 dp.include_router(router)
@@ -75,72 +100,54 @@ def init_db():
         }
     }
 
-def load_db():
-    if not os.path.exists(DB_FILE):
-        db = init_db()
-        with open(DB_FILE, 'w', encoding='utf-8') as f:
-            json.dump(db, f, ensure_ascii=False, indent=2)
-        return db
-    
-    try:
-        with open(DB_FILE, 'r', encoding='utf-8') as f:
-            db = json.load(f)
-            
-            # Добавляем отсутствующие поля для совместимости
-            for user in db['approved']:
-                if 'banned_until' not in user:
-                    user['banned_until'] = None
-                if 'is_admin' not in user:
-                    user['is_admin'] = (user['user_id'] == ADMIN_ID)
-            
-            return db
-    except (json.JSONDecodeError, FileNotFoundError):
-        db = init_db()
-        with open(DB_FILE, 'w', encoding='utf-8') as f:
-            json.dump(db, f, ensure_ascii=False, indent=2)
-        return db
+def create_storage():
+    if STORAGE_BACKEND == 'sqlite':
+        return SqliteStorage(SQLITE_FILE, codec=codec)
+    return JsonStorage(DB_FILE, JOURNAL_FILE, COMPLAINTS_FILE, compact_every=JOURNAL_COMPACT_EVERY,
+                       compact_json=DB_COMPACT_JSON, codec=codec)
+
+database = Database(create_storage(), init_db, upgrade_db, save_interval=SAVE_INTERVAL,
+                    reaction_interval=REACTION_FLUSH_INTERVAL)
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+markup_updater = MarkupUpdater(bot, MARKUP_EDIT_INTERVAL)
 
-def save_db(db):
-    with open(DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
+# Отправитель определяется один раз за обновление, права проверяются по флагам обработчиков
+throttling = ThrottlingMiddleware(THROTTLE_LIMITS, THROTTLE_CLEANUP_INTERVAL)
+for observer in (dp.message, dp.callback_query):
+    observer.outer_middleware(UserMiddleware(database, ADMIN_ID))
+    observer.outer_middleware(throttling)  # после UserMiddleware: нужен is_admin
+for observer in (router.message, router.callback_query):
+    observer.middleware(AccessMiddleware())
+
+def load_db():
+    """Возвращает базу из памяти (из хранилища читается только при первом обращении)"""
+    return database.get()
 
 def generate_code():
-    return ''.join(random.choices(string.digits, k=6))
+    return database.users.generate_code()
 
-async def check_ban(user_id: int) -> bool:
-    """Проверяет, забанен ли пользователь"""
-    db = load_db()
-    user = next((u for u in db['approved'] if u['user_id'] == user_id), None)
-    
-    if not user or not user.get('banned_until'):
-        return False
+async def lift_expired_ban(user_id: int):
+    """Снимает бан, срок которого истёк, и сообщает об этом пользователю"""
+    async with database.transaction():
+        if not database.bans.expired(user_id):
+            return  # Бан успели продлить или снять
+        database.apply('user_update', user_id=user_id, fields={'banned_until': None})
     
     try:
-        ban_until = datetime.strptime(user['banned_until'], "%Y-%m-%d %H:%M:%S")
-        if datetime.now() < ban_until:
-            return True
-        else:
-            # Если время бана истекло, автоматически разбаниваем
-            user['banned_until'] = None
-            save_db(db)
-            return False
-    except:
-        # Если возникла ошибка при парсинге даты
-        user['banned_until'] = None
-        save_db(db)
-        return False
+        await bot.send_message(user_id, "✅ Срок вашей блокировки истёк. Вы снова можете пользоваться всеми функциями.")
+    except Exception:
+        pass  # Пользователь мог заблокировать бота
 
 # Основные команды
 @router.message(Command("start"))
-async def cmd_start(message: Message):
-    db = load_db()
-    if any(u['user_id'] == message.from_user.id for u in db['approved']):
+async def cmd_start(message: Message, user):
+    if user:
         await message.answer("👋 С возвращением! Используйте /help для списка команд")
     else:
         await message.answer("👋 Добро пожаловать! Для регистрации используйте /reg")
 
 @router.message(Command("help"))
-async def cmd_help(message: Message):
+async def cmd_help(message: Message, is_admin: bool):
     help_text = """📚 Доступные команды:
 /start - Начало работы
 /help - Справка
@@ -148,8 +155,9 @@ async def cmd_help(message: Message):
 /profile - Ваш профиль
 /newpost - Создать пост
 /posts - Лента публикаций
-/top - топ постов
-/comments [номер] - коменты
+/top [day|week|all] - топ постов
+/search [запрос] - Поиск по постам
+/comments [номер] - Комментарии к посту
 /comment [номер] - Комментировать
 /like [номер] - Лайкнуть
 /dislike [номер] - Дизлайкнуть
@@ -158,14 +166,16 @@ async def cmd_help(message: Message):
 /support [вопрос] - Связь с админом
 """
     
-    if message.from_user.id == ADMIN_ID:
+    if is_admin:
         help_text += """\n\n⚙️ Админ-команды:
 /ban [код] [время] - Забанить
 /unban [код] - Разбанить
 /broadcast [текст] - Рассылка
-/complaints - Жалобы
+/complaints [статус] [код] - Жалобы (/complaints top — нарушители)
 /users - Список пользователей
 /update - Тех. работы
+/jobs - Ход рассылок
+/iostats - Задержки event loop и диска
 /adminstart - отправляет всем сообщение о том что техработы закончены"""
     
     await message.answer(help_text)
@@ -173,8 +183,7 @@ async def cmd_help(message: Message):
 # Регистрация пользочки у тебя.вателя
 @router.message(Command("reg"))
 async def reg_start(message: Message, state: FSMContext):
-    db = load_db()
-    if any(u['user_id'] == message.from_user.id for u in db['approved'] + db['pending']):
+    if database.users.is_registered(message.from_user.id):
         await message.answer("❌ Вы уже зарегистрированы или ваша заявка на рассмотрении")
         return
     
@@ -207,10 +216,9 @@ async def reg_class(message: Message, state: FSMContext):
 
 @router.message(RegStates.username)
 async def reg_username(message: Message, state: FSMContext):
-    db = load_db()
     data = await state.get_data()
     
-    user_data = {
+    user_data = USER.build({
         'user_id': message.from_user.id,
         'account_code': generate_code(),
         'last_name': data['last_name'],
@@ -221,10 +229,16 @@ async def reg_username(message: Message, state: FSMContext):
         'bio': "Пока ничего не рассказал о себе",
         'posts': [],
         'is_admin': False
-    }
+    })
     
-    db['pending'].append(user_data)
-    save_db(db)
+    async with database.transaction():
+        registered = database.users.is_registered(message.from_user.id)
+        if not registered:
+            database.apply('user_register', user=user_data)
+    if registered:
+        await message.answer("❌ Вы уже зарегистрированы или ваша заявка на рассмотрении")
+        await state.clear()
+        return
     
     # Уведомление админа
     builder = InlineKeyboardBuilder()
@@ -246,15 +260,8 @@ async def reg_username(message: Message, state: FSMContext):
     await message.answer(f"✅ Заявка отправлена! Ваш код: {user_data['account_code']}")
     await state.clear()
 
-@router.message(Command("profile"))
-async def profile(message: Message):
-    db = load_db()
-    user = next((u for u in db['approved'] if u['user_id'] == message.from_user.id), None)
-    
-    if not user:
-        await message.answer("❌ Вы не зарегистрированы!")
-        return
-    
+@router.message(Command("profile"), flags={'registered': True})
+async def profile(message: Message, user, is_admin: bool):
     full_name = f"{user['last_name']} {user['first_name']} {user['middle_name']}".strip()
     text = f"""👤 Ваш профиль:
 ФИО: {full_name}
@@ -263,8 +270,8 @@ async def profile(message: Message):
 О себе: {user['bio']}"""
     
     # Для админа: просмотр любого профиля
-    if message.from_user.id == ADMIN_ID and len(message.text.split()) > 1:
-        target = next((u for u in db['approved'] if u['account_code'] == message.text.split()[1]), None)
+    if is_admin and len(message.text.split()) > 1:
+        target = database.users.by_code(message.text.split()[1])
         if target:
             full_name = f"{target['last_name']} {target['first_name']} {target['middle_name']}".strip()
             text = f"""👤 Профиль (админ):
@@ -278,10 +285,9 @@ Telegram ID: {target['user_id']}"""
 
 @router.message(RegStates.username)
 async def reg_username(message: Message, state: FSMContext):
-    db = load_db()
     data = await state.get_data()
     
-    user_data = {
+    user_data = USER.build({
         'user_id': message.from_user.id,
         'account_code': generate_code(),
         'last_name': data['last_name'],
@@ -293,10 +299,16 @@ async def reg_username(message: Message, state: FSMContext):
         'posts': [],
         'is_admin': False,
         'banned_until': None
-    }
+    })
     
-    db['pending'].append(user_data)
-    save_db(db)
+    async with database.transaction():
+        registered = database.users.is_registered(message.from_user.id)
+        if not registered:
+            database.apply('user_register', user=user_data)
+    if registered:
+        await message.answer("❌ Вы уже зарегистрированы или ваша заявка на рассмотрении")
+        await state.clear()
+        return
     
     builder = InlineKeyboardBuilder()
     builder.add(
@@ -314,84 +326,144 @@ async def reg_username(message: Message, state: FSMContext):
     await state.clear()
 
 # Команды для работы с постами
+COMMENTS_PAGE_SIZE = 10
+COMMENT_TEXT_LIMIT = 300
+
+def render_comments_page(post_id, offset):
+    """Страница комментариев к посту: COMMENTS_PAGE_SIZE штук начиная с offset (старые первыми)"""
+    post = database.get()['posts'][post_id - 1]
+    total = database.comments.count(post_id)
+    offset = max(0, min(offset, (total - 1) // COMMENTS_PAGE_SIZE * COMMENTS_PAGE_SIZE))
+    page = database.comments.page(post_id, offset, COMMENTS_PAGE_SIZE)
+    
+    post_text = post['text'] or ''
+    text = f"💬 Комментарии к посту #{post_id}:\n{'='*20}\n"
+    text += f"{post_text[:100]}{'...' if len(post_text) > 100 else ''}\n{'='*20}\n\n"
+    for i, comment in enumerate(page, offset + 1):
+        comment_text = comment['text'] or ''
+        if len(comment_text) > COMMENT_TEXT_LIMIT:
+            comment_text = comment_text[:COMMENT_TEXT_LIMIT] + "..."
+        text += f"{i}. {comment['author_name']}:\n{comment_text}\n\n"
+    text += f"📊 Показаны {offset + 1}–{offset + len(page)} из {total}"
+    
+    builder = InlineKeyboardBuilder()
+    if offset > 0:
+        builder.add(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=f"comments_{post_id}_{offset - COMMENTS_PAGE_SIZE}"
+        ))
+    if offset + COMMENTS_PAGE_SIZE < total:
+        builder.add(InlineKeyboardButton(
+            text="Далее ➡️",
+            callback_data=f"comments_{post_id}_{offset + COMMENTS_PAGE_SIZE}"
+        ))
+    return text, builder.as_markup()
+
 @router.message(Command("comments"))
 async def cmd_comments(message: Message):
-    """Просмотр комментариев под постом"""
+    """Просмотр комментариев под постом (по страницам)"""
     try:
         post_id = int(message.text.split()[1])
-        db = load_db()
         
-        if post_id < 1 or post_id > len(db['posts']):
+        if post_id < 1 or post_id > database.posts_count():
             await message.answer("❌ Неверный номер поста")
             return
         
-        post = db['posts'][post_id-1]
-        
-        if not post['comments']:
+        if not database.comments.count(post_id):
             await message.answer(f"📭 Нет комментариев под постом #{post_id}")
             return
         
-        # Формируем заголовок
-        text = f"💬 Комментарии к посту #{post_id}:\n{'='*20}\n"
-        text += f"{post['text'][:100]}{'...' if len(post['text']) > 100 else ''}\n{'='*20}\n\n"
-        
-        # Добавляем комментарии
-        for i, comment in enumerate(post['comments'], 1):
-            text += f"{i}. {comment['author_name']}:\n{comment['text']}\n\n"
-        
-        # Добавляем статистику
-        text += f"📊 Всего комментариев: {len(post['comments'])}"
-        
-        await message.answer(text)
+        text, markup = render_comments_page(post_id, 0)
+        await message.answer(text, reply_markup=markup)
     except (IndexError, ValueError):
         await message.answer("ℹ️ Используйте: /comments [номер_поста]\nПример: /comments 3")
 
+@router.callback_query(F.data.startswith("comments_"))
+async def comments_navigate(callback: CallbackQuery):
+    """Листание комментариев: в callback_data номер поста и смещение страницы"""
+    _, post_id, offset = callback.data.split('_')
+    text, markup = render_comments_page(int(post_id), int(offset))
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest:
+        pass  # Страница не изменилась
+    await callback.answer()
+
+def add_post_buttons(builder, post, numbered=False):
+    """Ряд кнопок поста: лайк, дизлайк и комментарий со счётчиками
+    
+    numbered — подписать номер поста (в списках из нескольких постов).
+    """
+    label = f"#{post['id']} " if numbered else ""
+    builder.row(
+        InlineKeyboardButton(text=f"{label}❤️ {post['likes']}", callback_data=f"like_{post['id']}"),
+        InlineKeyboardButton(text=f"👎 {post['dislikes']}", callback_data=f"dislike_{post['id']}"),
+        InlineKeyboardButton(text=f"💬 {database.comments.count(post['id'])}", callback_data=f"comment_{post['id']}"),
+    )
+
+def refresh_post_buttons(markup):
+    """Та же клавиатура сообщения, но с текущими счётчиками на кнопках постов
+    
+    Подходит для любого вида (карточка, лента, топ, поиск): остальные ряды
+    (листание) остаются как есть.
+    """
+    posts = database.get()['posts']
+    builder = InlineKeyboardBuilder()
+    for row in markup.inline_keyboard:
+        data = row[0].callback_data or ''
+        if data.startswith('like_'):
+            # В старых сообщениях после номера поста может идти страница ленты
+            post = posts[int(data.split('_')[1]) - 1]
+            add_post_buttons(builder, post, numbered=row[0].text.startswith('#'))
+        else:
+            builder.row(*row)
+    return builder.as_markup()
+
+def render_post(post_id):
+    """Карточка поста с последними комментариями и кнопками реакций"""
+    post = database.get()['posts'][post_id - 1]
+    
+    # Формируем основное сообщение (счётчики — на кнопках)
+    text = f"📝 Пост #{post_id} от {post['author_name']}:\n{'='*30}\n"
+    text += f"{post['text']}\n{'='*30}\n\n"
+    
+    # Добавляем последние комментарии
+    latest = database.comments.latest(post_id)
+    if latest:
+        text += "💬 Последние комментарии:\n"
+        for comment in latest:
+            comment_text = comment['text'] or ''
+            text += f"- {comment['author_name']}: {comment_text[:50]}"
+            text += "..." if len(comment_text) > 50 else ""
+            text += "\n"
+        text += f"\n👉 Полный список: /comments {post_id}"
+    else:
+        text += "📭 Комментариев пока нет"
+    
+    builder = InlineKeyboardBuilder()
+    add_post_buttons(builder, post)
+    return text, builder.as_markup()
+
+def render_post_cached(post_id):
+    return render_cache.get(('post', post_id), database.versions[('post', post_id)],
+                            lambda: render_post(post_id))
+
 @router.message(Command("post"))
 async def cmd_post(message: Message):
     """Просмотр поста с комментариями (альтернативный вариант)"""
     try:
         post_id = int(message.text.split()[1])
-        db = load_db()
         
-        if post_id < 1 or post_id > len(db['posts']):
+        if post_id < 1 or post_id > database.posts_count():
             await message.answer("❌ Неверный номер поста")
             return
         
-        post = db['posts'][post_id-1]
-        
-        # Формируем основное сообщение
-        text = f"📝 Пост #{post_id} от {post['author_name']}:\n{'='*30}\n"
-        text += f"{post['text']}\n{'='*30}\n"
-        text += f"❤️ {post.get('likes', 0)} | 👎 {post.get('dislikes', 0)} | 💬 {len(post['comments'])}\n\n"
-        
-        # Добавляем 3 последних комментария
-        if post['comments']:
-            text += "💬 Последние комментарии:\n"
-            for comment in post['comments'][-3:]:
-                text += f"- {comment['author_name']}: {comment['text'][:50]}"
-                text += "..." if len(comment['text']) > 50 else ""
-                text += "\n"
-            text += f"\n👉 Полный список: /comments {post_id}"
-        else:
-            text += "📭 Комментариев пока нет"
-        
-        # Кнопка "Комментировать"
-        builder = InlineKeyboardBuilder()
-        builder.add(
-            types.InlineKeyboardButton(
-                text="💬 Комментировать",
-                callback_data=f"comment_{post_id}"
-            )
-        )
-        
-        await message.answer(
-            text,
-            reply_markup=builder.as_markup()
-        )
+        text, markup = render_post_cached(post_id)
+        await message.answer(text, reply_markup=markup)
     except (IndexError, ValueError):
         await message.answer("ℹ️ Используйте: /post [номер_поста]\nПример: /post 3")
 
-@router.callback_query(F.data.startswith("comment_"))
+@router.callback_query(F.data.startswith("comment_"), flags={'registered': True, 'not_banned': "⛔ Вы заблокированы и не можете оставлять комментарии"})
 async def start_commenting(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки комментария"""
     post_id = int(callback.data.split('_')[1])
@@ -399,144 +471,221 @@ async def start_commenting(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(f"💬 Введите ваш комментарий к посту #{post_id}:")
     await state.set_state(CommentStates.text)
     await callback.answer()
+SEARCH_PAGE_SIZE = 5
+SEARCH_TEXT_LIMIT = 150
+
+def render_search_page(query, offset):
+    """Страница результатов поиска: самые подходящие посты первыми"""
+    results = database.search_posts(query)
+    if not results:
+        return f"🔍 По запросу «{query}» ничего не найдено", None
+    offset = max(0, min(offset, (len(results) - 1) // SEARCH_PAGE_SIZE * SEARCH_PAGE_SIZE))
+    page = results[offset:offset + SEARCH_PAGE_SIZE]
+    
+    text = f"🔍 «{query}»: {offset + 1}–{offset + len(page)} из {len(results)}\n\n"
+    for post, _ in page:
+        post_text = post['text'] or ''
+        if len(post_text) > SEARCH_TEXT_LIMIT:
+            post_text = post_text[:SEARCH_TEXT_LIMIT] + "..."
+        text += f"#{post['id']} {post['author_name']}:\n{post_text}\n👉 /post {post['id']}\n\n"
+    
+    builder = InlineKeyboardBuilder()
+    for post, _ in page:
+        add_post_buttons(builder, post, numbered=True)
+    navigation = []
+    if offset > 0:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"search_{offset - SEARCH_PAGE_SIZE}"))
+    if offset + SEARCH_PAGE_SIZE < len(results):
+        navigation.append(InlineKeyboardButton(text="Далее ➡️", callback_data=f"search_{offset + SEARCH_PAGE_SIZE}"))
+    builder.row(*navigation)
+    return text, builder.as_markup()
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, state: FSMContext):
+    """Поиск по текстам постов и комментариев"""
+    query = message.text.partition(' ')[2].strip()
+    if not query:
+        await message.answer("ℹ️ Используйте: /search [запрос]\nПример: /search олимпиада по физике")
+        return
+    
+    # Запрос не помещается в callback_data (64 байта) — листание берёт его из данных диалога
+    await state.update_data(search_query=query)
+    text, markup = render_search_page(query, 0)
+    await message.answer(text, reply_markup=markup)
+
+@router.callback_query(F.data.startswith("search_"))
+async def search_navigate(callback: CallbackQuery, state: FSMContext):
+    query = (await state.get_data()).get('search_query')
+    if not query:
+        await callback.answer("ℹ️ Повторите поиск: /search [запрос]", show_alert=True)
+        return
+    text, markup = render_search_page(query, int(callback.data.split('_')[1]))
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest:
+        pass  # Страница не изменилась
+    await callback.answer()
+
+TOP_PERIODS = {
+    'day': "за сутки",
+    'week': "за неделю",
+    'all': "за всё время",
+}
+
 @router.message(Command("top"))
 async def cmd_top(message: Message):
-    db = load_db()
-    top_posts = sorted(db['posts'], key=lambda x: x['likes'] - x.get('dislikes', 0), reverse=True)[:5]
+    args = message.text.split()
+    period = args[1].lower() if len(args) > 1 else 'all'
+    if period not in TOP_PERIODS:
+        await message.answer("ℹ️ Используйте: /top [day|week|all]")
+        return
+    
+    # Счётчики комментариев на кнопках меняют ответ, но не рейтинг
+    version = (database.ranking_version(period), database.versions['posts'])
+    text, markup = render_cache.get(('top', period), version, lambda: render_top(period))
+    await message.answer(text, reply_markup=markup)
+
+def render_top(period):
+    top_posts = database.top_posts(5, period)
     
     if not top_posts:
-        await message.answer("📭 Пока нет постов для рейтинга")
-        return
+        return "📭 Пока нет постов для рейтинга", None
     
-    text = "🏆 Топ постов:\n\n"
-    for i, post in enumerate(top_posts, 1):
-        rating = post['likes'] - post.get('dislikes', 0)
+    text = f"🏆 Топ постов {TOP_PERIODS[period]}:\n\n"
+    builder = InlineKeyboardBuilder()
+    for i, (post, rating) in enumerate(top_posts, 1):
         text += f"{i}. #{post['id']} ({rating} баллов)\n"
-        text += f"{post['text'][:50]}...\n\n"
-    
-    await message.answer(text)
+        text += f"{(post['text'] or '')[:50]}...\n\n"
+        add_post_buttons(builder, post, numbered=True)
+    return text, builder.as_markup()
 
-@router.message(Command("newpost"))
+@router.message(Command("newpost"), flags={'registered': True, 'not_banned': "⛔ Вы заблокированы и не можете создавать посты"})
 async def cmd_newpost(message: Message, state: FSMContext):
-    if await check_ban(message.from_user.id):
-        await message.answer("⛔ Вы заблокированы и не можете создавать посты")
-        return
-    
-    db = load_db()
-    if not any(u['user_id'] == message.from_user.id for u in db['approved']):
-        await message.answer("❌ Вы не зарегистрированы!")
-        return
-    
     await message.answer("📝 Напишите текст поста:")
     await state.set_state(PostStates.text)
 
-@router.message(PostStates.text)
-async def newpost_finish(message: Message, state: FSMContext):
-    db = load_db()
-    user = next(u for u in db['approved'] if u['user_id'] == message.from_user.id)
-    
-    post = {
-        'id': len(db['posts']) + 1,
+@router.message(PostStates.text, flags={'registered': True})
+async def newpost_finish(message: Message, state: FSMContext, user):
+    post = POST.build({
         'author_id': message.from_user.id,
         'author_name': f"{user['last_name']} {user['first_name']}",
         'text': message.text,
-        'likes': 0,
-        'dislikes': 0,
-        'liked_by': [],
-        'disliked_by': [],
-        'comments': [],
         'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+    })
     
-    db['posts'].append(post)
-    save_db(db)
-    await message.answer("✅ Пост опубликован!")
+    async with database.transaction():
+        database.apply('post_add', post=post)  # Номер поста назначает база
+    await message.answer(f"✅ Пост #{post['id']} опубликован!")
     await state.clear()
 
 @router.message(Command("posts"))
 async def cmd_posts(message: Message):
-    db = load_db()
-    if not db['posts']:
+    if not database.posts_count():
         await message.answer("📭 Пока нет ни одного поста")
         return
     
-    text = "📜 Последние посты:\n\n"
-    for post in db['posts'][-10:][::-1]:  # Последние 10 постов (новые сверху)
-        text += f"#{post['id']} {post['author_name']}:\n{post['text']}\n"
-        text += f"❤️ {post['likes']} | 👎 {post['dislikes']} | 💬 {len(post['comments'])}\n\n"
+    text, markup = render_feed_page(database.posts_count())
+    await message.answer(text, reply_markup=markup)
+
+@router.callback_query(F.data.startswith("posts_"))
+async def feed_navigate(callback: CallbackQuery):
+    """Листание ленты: в callback_data номер верхнего поста страницы"""
+    top_id = int(callback.data.split('_')[1])
+    text, markup = render_feed_page(top_id)
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest:
+        pass  # Страница не изменилась
+    await callback.answer()
+
+FEED_PAGE_SIZE = 5
+FEED_TEXT_LIMIT = 300
+
+def render_feed_page(top_id):
+    """Страница ленты: FEED_PAGE_SIZE постов начиная с top_id и старше (новые сверху)"""
+    top_id = max(1, min(top_id, database.posts_count()))
+    return render_cache.get(('posts', top_id), database.versions['posts'], lambda: _render_feed_page(top_id))
+
+def _render_feed_page(top_id):
+    total = database.posts_count()
+    text = "📜 Последние посты:\n\n" if top_id == total else "📜 Лента:\n\n"
+    builder = InlineKeyboardBuilder()
+    for post in database.posts_page(top_id, FEED_PAGE_SIZE):
+        post_text = post['text'] or ''
+        if len(post_text) > FEED_TEXT_LIMIT:
+            post_text = post_text[:FEED_TEXT_LIMIT] + "..."
+        text += f"#{post['id']} {post['author_name']}:\n{post_text}\n\n"
+        add_post_buttons(builder, post, numbered=True)
+    
+    navigation = []
+    if top_id < total:
+        navigation.append(InlineKeyboardButton(
+            text="⬅️ Новее",
+            callback_data=f"posts_{min(top_id + FEED_PAGE_SIZE, total)}"
+        ))
+    if top_id > FEED_PAGE_SIZE:
+        navigation.append(InlineKeyboardButton(
+            text="Старее ➡️",
+            callback_data=f"posts_{top_id - FEED_PAGE_SIZE}"
+        ))
+    builder.row(*navigation)
+    return text, builder.as_markup()
+
+@router.callback_query(F.data.startswith("like_") | F.data.startswith("dislike_"),
+                       flags={'not_banned': "⛔ Вы заблокированы и не можете ставить реакции"})
+async def react_button(callback: CallbackQuery):
+    """Кнопки реакций like_{пост} / dislike_{пост} под любым видом с постами"""
+    kind, post_id = callback.data.split('_')[:2]
+    post_id = int(post_id)
+    reacted, reply = react(post_id, callback.from_user.id, kind)
+    await callback.answer(reply)
+    if not reacted:
+        return
     
-    await message.answer(text)
+    # Счётчики на кнопках обновятся одной правкой на все нажатия за интервал
+    markup = callback.message.reply_markup
+    markup_updater.schedule(callback.message.chat.id, callback.message.message_id,
+                            lambda: refresh_post_buttons(markup))
 
 # Лайки/дизлайки
-@router.message(Command("like"))
+REACTION_REPLIES = {  # реакция -> (учтена, уже стоит)
+    'like': ("❤️ Ваш лайк учтен!", "❌ Вы уже ставили лайк этому посту"),
+    'dislike': ("👎 Ваш дизлайк учтен!", "❌ Вы уже ставили дизлайк этому посту"),
+}
+
+def react(post_id, user_id, kind):
+    """Ставит реакцию для /like, /dislike и кнопок: (поставлена ли, текст ответа)
+    
+    Реакция видна сразу, на диск буфер реакций пишется пачкой.
+    """
+    if post_id < 1 or post_id > database.posts_count():
+        return False, "❌ Неверный номер поста"
+    done, already = REACTION_REPLIES[kind]
+    if not database.react(post_id, user_id, kind):
+        return False, already
+    return True, done
+
+@router.message(Command("like"), flags={'not_banned': "⛔ Вы заблокированы и не можете ставить лайки"})
 async def cmd_like(message: Message):
-    if await check_ban(message.from_user.id):
-        await message.answer("⛔ Вы заблокированы и не можете ставить лайки")
-        return
-    
     try:
         post_id = int(message.text.split()[1])
-        db = load_db()
-        
-        if post_id < 1 or post_id > len(db['posts']):
-            await message.answer("❌ Неверный номер поста")
-            return
-        
-        post = db['posts'][post_id-1]
-        
-        if message.from_user.id in post['liked_by']:
-            await message.answer("❌ Вы уже ставили лайк этому посту")
-            return
-        
-        if message.from_user.id in post['disliked_by']:
-            post['dislikes'] -= 1
-            post['disliked_by'].remove(message.from_user.id)
-        
-        post['likes'] += 1
-        post['liked_by'].append(message.from_user.id)
-        save_db(db)
-        await message.answer("❤️ Ваш лайк учтен!")
+        _, reply = react(post_id, message.from_user.id, 'like')
+        await message.answer(reply)
     except (IndexError, ValueError):
         await message.answer("❌ Используйте: /like [номер_поста]")
 
-@router.message(Command("dislike"))
+@router.message(Command("dislike"), flags={'not_banned': "⛔ Вы заблокированы и не можете ставить дизлайки"})
 async def cmd_dislike(message: Message):
-    if await check_ban(message.from_user.id):
-        await message.answer("⛔ Вы заблокированы и не можете ставить дизлайки")
-        return
-    
     try:
         post_id = int(message.text.split()[1])
-        db = load_db()
-        
-        if post_id < 1 or post_id > len(db['posts']):
-            await message.answer("❌ Неверный номер поста")
-            return
-        
-        post = db['posts'][post_id-1]
-        
-        if message.from_user.id in post['disliked_by']:
-            await message.answer("❌ Вы уже ставили дизлайк этому посту")
-            return
-        
-        if message.from_user.id in post['liked_by']:
-            post['likes'] -= 1
-            post['liked_by'].remove(message.from_user.id)
-        
-        post['dislikes'] += 1
-        post['disliked_by'].append(message.from_user.id)
-        save_db(db)
-        await message.answer("👎 Ваш дизлайк учтен!")
+        _, reply = react(post_id, message.from_user.id, 'dislike')
+        await message.answer(reply)
     except (IndexError, ValueError):
         await message.answer("❌ Используйте: /dislike [номер_поста]")
 
 # Комментарии
-@router.message(Command("comment"))
+@router.message(Command("comment"), flags={'registered': True, 'not_banned': "⛔ Вы заблокированы и не можете оставлять комментарии"})
 async def cmd_comment(message: Message, state: FSMContext):
-    if await check_ban(message.from_user.id):
-        await message.answer("⛔ Вы заблокированы и не можете оставлять комментарии")
-        return
-    
     try:
         post_id = int(message.text.split()[1])
         await state.update_data(post_id=post_id)
@@ -545,49 +694,37 @@ async def cmd_comment(message: Message, state: FSMContext):
     except (IndexError, ValueError):
         await message.answer("❌ Используйте: /comment [номер_поста]")
 
-@router.message(CommentStates.text)
-async def comment_finish(message: Message, state: FSMContext):
+@router.message(CommentStates.text, flags={'registered': True})
+async def comment_finish(message: Message, state: FSMContext, user):
     db = load_db()
     data = await state.get_data()
     post_id = data['post_id']
-    user = next(u for u in db['approved'] if u['user_id'] == message.from_user.id)
     
     if post_id < 1 or post_id > len(db['posts']):
         await message.answer("❌ Неверный номер поста")
         await state.clear()
         return
     
-    comment = {
+    comment = COMMENT.build({
         'author_id': message.from_user.id,
         'author_name': f"{user['last_name']} {user['first_name']}",
         'text': message.text,
         'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+    })
     
-    db['posts'][post_id-1]['comments'].append(comment)
-    save_db(db)
+    async with database.transaction():
+        database.apply('comment_add', post_id=post_id, comment=comment)
     await message.answer("✅ Комментарий добавлен!")
     await state.clear()
 
 # Система жалоб
-@router.message(Command("complain"))
-async def cmd_complain(message: Message):
-    if await check_ban(message.from_user.id):
-        await message.answer("⛔ Вы заблокированы и не можете отправлять жалобы")
-        return
-    
+@router.message(Command("complain"), flags={'registered': True, 'not_banned': "⛔ Вы заблокированы и не можете отправлять жалобы"})
+async def cmd_complain(message: Message, user):
     try:
         _, target, *reason_parts = message.text.split(maxsplit=2)
         reason = ' '.join(reason_parts)
+        target_user = database.users.find(target)
         
-        db = load_db()
-        user = next((u for u in db['approved'] if u['user_id'] == message.from_user.id), None)
-        target_user = next((u for u in db['approved'] if u['account_code'] == target or u['username'] == target), None)
-        
-        if not user:
-            await message.answer("❌ Вы не зарегистрированы!")
-            return
-            
         if not target_user:
             await message.answer("❌ Пользователь не найден")
             return
@@ -596,7 +733,7 @@ async def cmd_complain(message: Message):
             await message.answer("❌ Нельзя жаловаться на себя")
             return
             
-        complaint = {
+        complaint = COMPLAINT.build({
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             'target_id': target_user['user_id'],
             'target_name': f"{target_user['last_name']} {target_user['first_name']}",
@@ -605,17 +742,11 @@ async def cmd_complain(message: Message):
             'complainant_name': f"{user['last_name']} {user['first_name']}",
             'reason': reason,
             'status': 'new'
-        }
-        
-        # Сохраняем жалобу в отдельный файл
-        complaints = []
-        if os.path.exists(COMPLAINTS_FILE):
-            with open(COMPLAINTS_FILE, 'r', encoding='utf-8') as f:
-                complaints = json.load(f)
+        })
         
-        complaints.append(complaint)
-        with open(COMPLAINTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(complaints, f, ensure_ascii=False, indent=2)
+        async with database.transaction():
+            database.apply('complaint_add', complaint=complaint)  # Номер жалобы назначает база
+        open_count = database.complaints.open_counts[target_user['user_id']]
         
         # Уведомление админа
         builder = InlineKeyboardBuilder()
@@ -627,12 +758,17 @@ async def cmd_complain(message: Message):
             InlineKeyboardButton(
                 text="🔨 Забанить",
                 callback_data=f"ban_from_{message.from_user.id}_{target_user['account_code']}"
+            ),
+            InlineKeyboardButton(
+                text="🚫 Отклонить",
+                callback_data=f"complaint_reject_{complaint['id']}"
             )
         )
         
         await bot.send_message(
             ADMIN_ID,
-            f"🚨 Новая жалоба:\nОт: {user['last_name']} {user['first_name']}\nНа: {target_user['last_name']} {target_user['first_name']}\nПричина: {reason}",
+            f"🚨 Новая жалоба #{complaint['id']}:\nОт: {user['last_name']} {user['first_name']}\nНа: {target_user['last_name']} {target_user['first_name']}\nПричина: {reason}\n"
+            f"Нерассмотренных жалоб на пользователя: {open_count}",
             reply_markup=builder.as_markup()
         )
         
@@ -641,25 +777,14 @@ async def cmd_complain(message: Message):
         await message.answer("❌ Формат: /complain [код/username] [причина]")
 
 # Система поддержки
-@router.message(Command("support"))
-async def cmd_support(message: Message):
-    if await check_ban(message.from_user.id):
-        await message.answer("⛔ Вы заблокированы и не можете обращаться в поддержку")
-        return
-    
+@router.message(Command("support"), flags={'registered': True, 'not_banned': "⛔ Вы заблокированы и не можете обращаться в поддержку"})
+async def cmd_support(message: Message, user):
     try:
         args = message.text.split(maxsplit=1)
         if len(args) < 2:
             await message.answer("ℹ️ Укажите ваш вопрос после команды /support")
             return
         
-        db = load_db()
-        user = next((u for u in db['approved'] if u['user_id'] == message.from_user.id), None)
-        
-        if not user:
-            await message.answer("❌ Вы не зарегистрированы!")
-            return
-        
         builder = InlineKeyboardBuilder()
         builder.add(
             InlineKeyboardButton(
@@ -683,23 +808,15 @@ async def cmd_support(message: Message):
 class SupportStates(StatesGroup):
     waiting_support_reply = State()
 
-@router.message(Command("support"))
-async def cmd_support(message: Message):
+@router.message(Command("support"), flags={'registered': "❌ Для использования этой команды нужно зарегистрироваться (/reg)"})
+async def cmd_support(message: Message, user):
     """Обработчик команды /support"""
-    db = load_db()
-    
-    # Проверка регистрации
-    if not any(user['user_id'] == message.from_user.id for user in db['approved']):
-        await message.answer("❌ Для использования этой команды нужно зарегистрироваться (/reg)")
-        return
-    
     # Получаем текст сообщения
     args = message.text.split(maxsplit=1)
     if len(args) < 2:
         await message.answer("ℹ️ Пожалуйста, укажите ваш вопрос:\nПример: /support Как создать пост?")
         return
     
-    user = next(u for u in db['approved'] if u['user_id'] == message.from_user.id)
     user_name = f"{user['last_name']} {user['first_name']}"
     
     # Формируем сообщение для админа
@@ -730,7 +847,7 @@ async def cmd_support(message: Message):
         logging.error(f"Ошибка отправки админу: {e}")
         await message.answer("❌ Произошла ошибка при отправке")
 
-@router.callback_query(F.data.startswith("reply_to_"))
+@router.callback_query(F.data.startswith("reply_to_"), flags={'admin': True})
 async def process_support_reply(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки ответа"""
     user_id = int(callback.data.split('_')[-1])
@@ -740,7 +857,7 @@ async def process_support_reply(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(f"💬 Введите ответ для пользователя (ID: {user_id}):")
     await state.set_state(SupportStates.waiting_support_reply)
 
-@router.message(SupportStates.waiting_support_reply)
+@router.message(SupportStates.waiting_support_reply, flags={'admin': True})
 async def send_support_reply(message: Message, state: FSMContext):
     """Отправка ответа пользователю"""
     data = await state.get_data()
@@ -763,100 +880,89 @@ async def send_support_reply(message: Message, state: FSMContext):
     
     await state.clear()
 
-@router.message(Command("adminstart"))
+@router.message(Command("adminstart"), flags={'admin': True})
 async def cmd_adminstart(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("⛔ У вас нет прав для этой команды!")
-        return
-
-    db = load_db()
-    sent_count = 0
-    
-    for user in db['approved']:
-        try:
-            await bot.send_message(user['user_id'], "Технические работы завершены! Теперь соцсеть снова работает! ")
-            sent_count += 1
-        except Exception as e:
-            logging.error(f"Не удалось отправить сообщение пользователю {user['user_id']}: {e}")
-    
-    await message.answer(f"✅ Сообщение отправлено {sent_count} пользователям!")
+    job = broadcast_queue.submit(database.users.approved, "Технические работы завершены! Теперь соцсеть снова работает! ")
+    await message.answer(f"📨 Рассылка #{job.id} запущена ({job.total} получателей). Прогресс: /jobs")
 
-@router.message(Command("users"))
+@router.message(Command("users"), flags={'admin': True})
 async def users_list(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("❌ Доступно только администраторам")
-        return
-    
-    db = load_db()
+    text = render_cache.get(('users_list',), database.versions['users'], render_users_list)
+    await message.answer(text)
+
+def render_users_list():
     text = "👥 Список пользователей:\n\n"
-    for user in db['approved']:
+    for user in load_db()['approved']:
         text += f"{user['last_name']} {user['first_name']} - {user['class']}\n"
         text += f"Код: {user['account_code']} | @{user['username']}\n\n"
-    
-    await message.answer(text)
+    return text
 
-@router.message(Command("broadcast"))
+@router.message(Command("broadcast"), flags={'admin': True})
 async def broadcast(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("❌ Доступно только администраторам")
-        return
-    
     if len(message.text.split()) < 2:
         await message.answer("❌ Формат: /broadcast [текст]")
         return
     
-    db = load_db()
     text = ' '.join(message.text.split()[1:])
-    sent = 0
-    
-    for user in db['approved']:
-        try:
-            await bot.send_message(user['user_id'], f"📢 Сообщение от администратора:\n\n{text}")
-            sent += 1
-        except:
-            continue
-    
-    await message.answer(f"✅ Сообщение отправлено {sent} пользователям")
+    job = broadcast_queue.submit(database.users.approved, f"📢 Сообщение от администратора:\n\n{text}")
+    await message.answer(f"📨 Рассылка #{job.id} запущена ({job.total} получателей). Прогресс: /jobs")
 
-@router.message(Command("update"))
+@router.message(Command("update"), flags={'admin': True})
 async def update_bot(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("❌ Доступно только администраторам")
-        return
+    job = broadcast_queue.submit(
+        database.users.approved,
+        "🔧 Технические работы\n\n"
+        "Соцсеть будет временно недоступна из-за обновлений. "
+        "Приносим извинения за неудобства!"
+    )
     
-    db = load_db()
-    sent = 0
+    async def shutdown(job):
+        await message.answer("🔌 Бот завершает работу...")
+        await stop_bot()  # Данные сохраняются при выходе из main()
     
-    for user in db['approved']:
-        try:
-            await bot.send_message(
-                user['user_id'],
-                "🔧 Технические работы\n\n"
-                "Соцсеть будет временно недоступна из-за обновлений. "
-                "Приносим извинения за неудобства!"
-            )
-            sent += 1
-        except:
-            continue
+    job.add_done_callback(shutdown)
+    await message.answer(f"📨 Рассылка #{job.id} запущена ({job.total} получателей). "
+                         f"Бот остановится после её завершения. Прогресс: /jobs")
+
+@router.message(Command("jobs"), flags={'admin': True})
+async def cmd_jobs(message: Message):
+    jobs = broadcast_queue.recent()
+    if not jobs:
+        await message.answer("ℹ️ Рассылок ещё не было")
+        return
     
-    await message.answer(f"✅ Уведомление отправлено {sent} пользователям. Бот завершает работу...")
-    save_db(db)  # Сохраняем данные перед выходом
-    exit(0)
+    text = "📨 Рассылки:\n\n"
+    for job in jobs:
+        text += f"{job.describe()}\n\n"
+    await message.answer(text)
+
+@router.message(Command("iostats"), flags={'admin': True})
+async def cmd_iostats(message: Message):
+    text = "⏱ Event loop:\n" + (loop_monitor.report() or "нет данных")
+    disk = '\n'.join(report for report in (database.timings.report(), disk_io.timings.report()) if report)
+    text += "\n\n💾 Диск:\n" + (disk or "записей ещё не было")
+    text += "\n\n🗂 Кэш ответов: " + (render_cache.report() or "запросов ещё не было")
+    await message.answer(text)
+
+async def notify_broadcast_done(job):
+    await bot.send_message(ADMIN_ID, f"✅ Рассылка #{job.id} завершена: {job.result}")
 
 # ========== ОБРАБОТКА КНОПОК ==========
-@router.callback_query(F.data.startswith("approve_") | F.data.startswith("reject_"))
+@router.callback_query(F.data.startswith("approve_") | F.data.startswith("reject_"), flags={'admin': True})
 async def process_registration(callback: CallbackQuery):
-    db = load_db()
     action, user_id = callback.data.split('_')
     user_id = int(user_id)
     
-    user = next((u for u in db['pending'] if u['user_id'] == user_id), None)
+    async with database.transaction():
+        user = database.users.get_pending(user_id)
+        if user:
+            database.apply('user_approve' if action == "approve" else 'user_reject', user_id=user_id)
+    
     if not user:
         await callback.answer("Пользователь не найден")
         return
     
     if action == "approve":
-        db['approved'].append(user)
         await bot.send_message(
             user_id,
             "🎉 Ваша заявка одобрена! Теперь вы можете пользоваться всеми функциями."
@@ -873,34 +979,15 @@ async def process_registration(callback: CallbackQuery):
             f"❌ Заявка {user['last_name']} {user['first_name']} отклонена"
         )
     
-    db['pending'].remove(user)
-    save_db(db)
     await callback.answer()
 
-@router.message(Command("adminstart"))
+@router.message(Command("adminstart"), flags={'admin': True})
 async def cmd_adminstart(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("⛔ У вас нет прав для этой команды!")
-        return
+    job = broadcast_queue.submit(database.users.approved, "Технические работы завершены! Теперь соцсеть снова работает! ")
+    await message.answer(f"📨 Рассылка #{job.id} запущена ({job.total} получателей). Прогресс: /jobs")
 
-    db = load_db()
-    sent_count = 0
-    
-    for user in db['approved']:
-        try:
-            await bot.send_message(user['user_id'], "Технические работы завершены! Теперь соцсеть снова работает! ")
-            sent_count += 1
-        except Exception as e:
-            logging.error(f"Не удалось отправить сообщение пользователю {user['user_id']}: {e}")
-    cmd_help
-    await message.answer(f"✅ Сообщение отправлено {sent_count} пользователям!")
-
-@router.message(Command("ban"))
+@router.message(Command("ban"), flags={'admin': True})
 async def cmd_ban(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("❌ Эта команда только для администраторов")
-        return
-    
     try:
         args = message.text.split()
         if len(args) < 3:
@@ -910,9 +997,7 @@ async def cmd_ban(message: Message):
         target_code = args[1]
         ban_duration = args[2]
         reason = ' '.join(args[3:]) if len(args) > 3 else "Не указана"
-        db = load_db()
-        
-        target_user = next((u for u in db['approved'] if u['account_code'] == target_code), None)
+        target_user = database.users.by_code(target_code)
         if not target_user:
             await message.answer("❌ Пользователь с таким кодом не найден")
             return
@@ -927,8 +1012,9 @@ async def cmd_ban(message: Message):
             await message.answer("❌ Укажите время бана в формате: 7d (7 дней) или 24h (24 часа)")
             return
         
-        target_user['banned_until'] = ban_until.strftime("%Y-%m-%d %H:%M:%S")
-        save_db(db)
+        async with database.transaction():
+            database.apply('user_update', user_id=target_user['user_id'],
+                           fields={'banned_until': ban_until.strftime("%Y-%m-%d %H:%M:%S")})
         
         try:
             await bot.send_message(
@@ -943,12 +1029,8 @@ async def cmd_ban(message: Message):
         logging.error(f"Ошибка бана: {e}")
         await message.answer("❌ Произошла ошибка при блокировке пользователя")
 
-@router.message(Command("unban"))
+@router.message(Command("unban"), flags={'admin': True})
 async def cmd_unban(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("❌ Эта команда только для администраторов")
-        return
-    
     try:
         args = message.text.split()
         if len(args) < 2:
@@ -956,15 +1038,13 @@ async def cmd_unban(message: Message):
             return
         
         target_code = args[1]
-        db = load_db()
-        
-        target_user = next((u for u in db['approved'] if u['account_code'] == target_code), None)
+        target_user = database.users.by_code(target_code)
         if not target_user:
             await message.answer("❌ Пользователь с таким кодом не найден")
             return
         
-        target_user['banned_until'] = None
-        save_db(db)
+        async with database.transaction():
+            database.apply('user_update', user_id=target_user['user_id'], fields={'banned_until': None})
         
         try:
             await bot.send_message(
@@ -979,82 +1059,127 @@ async def cmd_unban(message: Message):
         logging.error(f"Ошибка разбана: {e}")
         await message.answer("❌ Произошла ошибка при разблокировке пользователя")
 
-@router.message(Command("complaints"))
+COMPLAINTS_PAGE_SIZE = 5
+
+def render_complaints_page(status, target_id, offset):
+    """Страница жалоб (свежие сверху); status — статус или 'all', target_id — 0 или нарушитель"""
+    ids = database.complaints.query(status=None if status == 'all' else status, target_id=target_id or None)
+    if not ids:
+        return "ℹ️ Жалоб нет", None
+    offset = max(0, min(offset, (len(ids) - 1) // COMPLAINTS_PAGE_SIZE * COMPLAINTS_PAGE_SIZE))
+    page = ids[offset:offset + COMPLAINTS_PAGE_SIZE]
+    
+    title = "все" if status == 'all' else COMPLAINT_STATUSES[status]
+    text = f"📜 Жалобы ({title}): {offset + 1}–{offset + len(page)} из {len(ids)}\n\n"
+    for complaint_id in page:
+        comp = database.complaints.get(complaint_id)
+        text += f"#{comp['id']} {COMPLAINT_STATUSES[comp['status']]}\nОт: {comp['complainant_name']}\n"
+        text += f"На: {comp['target_name']} (код {comp['target_code']}, всего жалоб: {database.complaints.counts[comp['target_id']]})\n"
+        text += f"Причина: {comp['reason']}\nДата: {comp['timestamp']}\n\n"
+    
+    builder = InlineKeyboardBuilder()
+    if offset > 0:
+        builder.add(InlineKeyboardButton(
+            text="⬅️ Новее",
+            callback_data=f"complaints_{status}_{target_id}_{offset - COMPLAINTS_PAGE_SIZE}"
+        ))
+    if offset + COMPLAINTS_PAGE_SIZE < len(ids):
+        builder.add(InlineKeyboardButton(
+            text="Старее ➡️",
+            callback_data=f"complaints_{status}_{target_id}_{offset + COMPLAINTS_PAGE_SIZE}"
+        ))
+    return text, builder.as_markup()
+
+@router.message(Command("complaints"), flags={'admin': True})
 async def cmd_complaints(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("❌ Эта команда только для администраторов")
-        return
+    """/complaints [new|resolved|rejected|all] [код/username] или /complaints top"""
+    args = message.text.split()[1:]
     
-    if not os.path.exists(COMPLAINTS_FILE):
-        await message.answer("ℹ️ Жалоб нет")
+    if args[:1] == ['top']:
+        offenders = database.complaints.repeat_offenders()
+        if not offenders:
+            await message.answer("ℹ️ Нерассмотренных жалоб нет")
+            return
+        text = "🚩 Больше всего нерассмотренных жалоб:\n\n"
+        for target_id, count in offenders:
+            target = database.users.get(target_id)
+            name = f"{target['last_name']} {target['first_name']} (код {target['account_code']})" if target else f"ID {target_id}"
+            text += f"{name}: {count} (всего {database.complaints.counts[target_id]})\n"
+        await message.answer(text)
         return
     
-    try:
-        with open(COMPLAINTS_FILE, 'r', encoding='utf-8') as f:
-            complaints = json.load(f)
-        
-        if not complaints:
-            await message.answer("ℹ️ Жалоб нет")
+    status = 'all'
+    if args and (args[0] in COMPLAINT_STATUSES or args[0] == 'all'):
+        status = args.pop(0)
+    target_id = 0
+    if args:
+        target = database.users.find(args[0])
+        if not target:
+            await message.answer("❌ Пользователь не найден\nФормат: /complaints [new|resolved|rejected|all] [код/username]")
             return
-        
-        text = "📜 Список жалоб:\n\n"
-        for i, comp in enumerate(complaints[-10:][::-1], 1):  # Последние 10 жалоб
-            text += f"{i}. От: {comp['complainant_name']}\nНа: {comp['target_name']}\nПричина: {comp['reason']}\nДата: {comp['timestamp']}\n\n"
-        
-        await message.answer(text)
-    except Exception as e:
-        logging.error(f"Ошибка загрузки жалоб: {e}")
-        await message.answer("❌ Произошла ошибка при загрузке жалоб")
+        target_id = target['user_id']
+    
+    text, markup = render_complaints_page(status, target_id, 0)
+    await message.answer(text, reply_markup=markup)
 
-@router.message(Command("users"))
-async def cmd_users(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("❌ Эта команда только для администраторов")
+@router.callback_query(F.data.startswith("complaints_"), flags={'admin': True})
+async def complaints_navigate(callback: CallbackQuery):
+    _, status, target_id, offset = callback.data.split('_')
+    text, markup = render_complaints_page(status, int(target_id), int(offset))
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest:
+        pass  # Страница не изменилась
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("complaint_reject_"), flags={'admin': True})
+async def reject_complaint(callback: CallbackQuery):
+    complaint_id = int(callback.data.split('_')[2])
+    async with database.transaction():
+        complaint = database.complaints.get(complaint_id)
+        if complaint and complaint['status'] == 'new':
+            database.apply('complaint_status', complaint_ids=[complaint_id], status='rejected')
+    
+    if not complaint:
+        await callback.answer("Жалоба не найдена")
         return
-    
-    db = load_db()
+    await callback.message.edit_reply_markup()
+    await callback.answer(f"Жалоба #{complaint_id}: {COMPLAINT_STATUSES[complaint['status']]}")
+
+@router.message(Command("users"), flags={'admin': True})
+async def cmd_users(message: Message):
+    # Баны снимаются операцией user_update, поэтому статус не устаревает вместе с версией
+    text = render_cache.get(('users',), database.versions['users'], render_users)
+    await message.answer(text)
+
+def render_users():
     text = "👥 Список пользователей:\n\n"
-    for user in db['approved']:
-        status = "🛑 Заблокирован" if user.get('banned_until') else "✅ Активен"
+    for user in load_db()['approved']:
+        status = "🛑 Заблокирован" if database.bans.is_banned(user['user_id']) else "✅ Активен"
         text += f"{user['last_name']} {user['first_name']} ({status})\n"
         text += f"Код: {user['account_code']} | @{user['username']}\n\n"
-    
-    await message.answer(text)
+    return text
 
-@router.message(Command("broadcast"))
+@router.message(Command("broadcast"), flags={'admin': True})
 async def cmd_broadcast(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("❌ Эта команда только для администраторов")
-        return
-    
     if len(message.text.split()) < 2:
         await message.answer("ℹ️ Формат: /broadcast [текст]")
         return
     
-    db = load_db()
     text = ' '.join(message.text.split()[1:])
-    sent = 0
-    
-    for user in db['approved']:
-        try:
-            await bot.send_message(user['user_id'], f"📢 Важное объявление:\n\n{text}")
-            sent += 1
-        except:
-            continue
-    
-    await message.answer(f"✅ Сообщение отправлено {sent} пользователям")
+    job = broadcast_queue.submit(database.users.approved, f"📢 Важное объявление:\n\n{text}")
+    await message.answer(f"📨 Рассылка #{job.id} запущена ({job.total} получателей). Прогресс: /jobs")
 
 # Обработчики callback-кнопок
-@router.callback_query(F.data.startswith("approve_"))
+@router.callback_query(F.data.startswith("approve_"), flags={'admin': True})
 async def approve_user(callback: CallbackQuery):
-    db = load_db()
     user_id = int(callback.data.split('_')[1])
-    user = next((u for u in db['pending'] if u['user_id'] == user_id), None)
+    async with database.transaction():
+        user = database.users.get_pending(user_id)
+        if user:
+            database.apply('user_approve', user_id=user_id)
     
     if user:
-        db['approved'].append(user)
-        db['pending'].remove(user)
-        save_db(db)
         
         try:
             await bot.send_message(user_id, "🎉 Ваша заявка одобрена! Теперь вы можете пользоваться всеми функциями.")
@@ -1065,15 +1190,15 @@ async def approve_user(callback: CallbackQuery):
     else:
         await callback.answer("Пользователь не найден")
 
-@router.callback_query(F.data.startswith("reject_"))
+@router.callback_query(F.data.startswith("reject_"), flags={'admin': True})
 async def reject_user(callback: CallbackQuery):
-    db = load_db()
     user_id = int(callback.data.split('_')[1])
-    user = next((u for u in db['pending'] if u['user_id'] == user_id), None)
+    async with database.transaction():
+        user = database.users.get_pending(user_id)
+        if user:
+            database.apply('user_reject', user_id=user_id)
     
     if user:
-        db['pending'].remove(user)
-        save_db(db)
         
         try:
             await bot.send_message(user_id, "😕 Ваша заявка была отклонена администратором.")
@@ -1084,7 +1209,7 @@ async def reject_user(callback: CallbackQuery):
     else:
         await callback.answer("Пользователь не найден")
 
-@router.callback_query(F.data.startswith("reply_to_"))
+@router.callback_query(F.data.startswith("reply_to_"), flags={'admin': True})
 async def reply_to_user(callback: CallbackQuery, state: FSMContext):
     user_id = int(callback.data.split('_')[2])
     await callback.message.edit_reply_markup()
@@ -1092,20 +1217,23 @@ async def reply_to_user(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(f"💬 Введите ответ для пользователя (ID: {user_id}):")
     await state.set_state(SupportStates.waiting_support_reply)
 
-@router.callback_query(F.data.startswith("ban_from_"))
+@router.callback_query(F.data.startswith("ban_from_"), flags={'admin': True})
 async def ban_from_complaint(callback: CallbackQuery):
     parts = callback.data.split('_')
     user_id = int(parts[2])  # ID жалобщика
     target_code = parts[3]   # Код пользователя для бана
     
-    db = load_db()
-    target_user = next((u for u in db['approved'] if u['account_code'] == target_code), None)
+    target_user = database.users.by_code(target_code)
     
     if target_user:
-        # Бан на 3 дня по умолчанию
+        # Бан на 3 дня по умолчанию; все новые жалобы на пользователя решены
         ban_until = datetime.now() + timedelta(days=3)
-        target_user['banned_until'] = ban_until.strftime("%Y-%m-%d %H:%M:%S")
-        save_db(db)
+        async with database.transaction():
+            database.apply('user_update', user_id=target_user['user_id'],
+                           fields={'banned_until': ban_until.strftime("%Y-%m-%d %H:%M:%S")})
+            open_ids = database.complaints.open_against(target_user['user_id'])
+            if open_ids:
+                database.apply('complaint_status', complaint_ids=open_ids, status='resolved')
         
         try:
             await bot.send_message(
@@ -1130,7 +1258,7 @@ async def ban_from_complaint(callback: CallbackQuery):
     else:
         await callback.answer("Пользователь не найден")
 
-@router.message(SupportStates.waiting_support_reply)
+@router.message(SupportStates.waiting_support_reply, flags={'admin': True})
 async def send_support_reply(message: Message, state: FSMContext):
     data = await state.get_data()
     user_id = data.get('support_user_id')
@@ -1153,9 +1281,43 @@ async def send_support_reply(message: Message, state: FSMContext):
     await state.clear()
 
 # Запуск бота
+webhook_stop = asyncio.Event()
+loop_monitor = LoopMonitor()
+
+async def stop_bot():
+    if RUN_MODE == 'webhook':
+        webhook_stop.set()
+    else:
+        await dp.stop_polling()
+
 async def main():
-    await dp.start_polling(bot)
+    database.load()
+    saver = asyncio.create_task(database.run_saver())
+    reaction_flusher = asyncio.create_task(database.run_reaction_flusher())
+    fsm_flusher = asyncio.create_task(storage.run_flusher())
+    loop_watcher = asyncio.create_task(loop_monitor.run())
+    unbanner = asyncio.create_task(database.bans.run(lift_expired_ban))
+    throttle_cleaner = asyncio.create_task(throttling.run_cleanup())
+    broadcast_queue.on_done = notify_broadcast_done
+    broadcast_queue.resume()
+    try:
+        if RUN_MODE == 'webhook':
+            await run_webhook(dp, bot, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH,
+                              secret=WEBHOOK_SECRET, url=WEBHOOK_URL, stop_event=webhook_stop)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        saver.cancel()
+        reaction_flusher.cancel()
+        fsm_flusher.cancel()
+        loop_watcher.cancel()
+        unbanner.cancel()
+        throttle_cleaner.cancel()
+        await markup_updater.close()
+        await broadcast_queue.close()
+        await storage.close()
+        await database.close()
+        disk_io.shutdown()
 
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main())
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+
+class MarkupUpdater:
+    """Отложенная правка клавиатур сообщений (счётчики на кнопках реакций)
+
+    Правка сообщения ждёт interval секунд; нажатия, пришедшие за это время,
+    объединяются в одну правку со свежей клавиатурой. Если нажатия продолжаются,
+    следующая правка того же сообщения будет не раньше чем через interval —
+    так частые нажатия не упираются в лимит Telegram на редактирование.
+    """
+
+    def __init__(self, bot, interval=1.0):
+        self.bot = bot
+        self.interval = interval
+        self._pending = {}              # (chat_id, message_id) -> render(), возвращающий клавиатуру
+        self._tasks = {}                # (chat_id, message_id) -> задача правки
+
+    def schedule(self, chat_id, message_id, render):
+        """Запрашивает правку; клавиатура строится render() в момент отправки"""
+        key = (chat_id, message_id)
+        self._pending[key] = render
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key):
+        try:
+            while key in self._pending:
+                await asyncio.sleep(self.interval)
+                render = self._pending.pop(key)
+                await self._edit(key, render())
+        finally:
+            del self._tasks[key]
+
+    async def _edit(self, key, markup):
+        chat_id, message_id = key
+        try:
+            await self.bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=markup)
+        except TelegramRetryAfter as e:
+            # Flood wait: откладываем правку, если за это время не пришла новая
+            await asyncio.sleep(e.retry_after)
+            if key not in self._pending:
+                await self._edit(key, markup)
+        except TelegramBadRequest:
+            pass  # Клавиатура не изменилась или сообщение удалено
+        except Exception as e:
+            logging.error(f"Ошибка обновления кнопок сообщения {message_id}: {e}")
+
+    async def close(self):
+        """Дожидается запланированных правок"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
@@ -0,0 +1,141 @@
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, TelegramObject
+
+Handler = Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]]
+
+
+class UserMiddleware(BaseMiddleware):
+    """Внешний middleware: один раз за обновление находит отправителя в базе
+
+    Обработчики получают user (одобренный пользователь или None), is_admin
+    и is_banned — достаточно добавить их в аргументы.
+    """
+
+    def __init__(self, database, admin_id):
+        self.database = database
+        self.admin_id = admin_id
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        from_user = data.get('event_from_user')
+        user_id = from_user.id if from_user else None
+        data['user'] = self.database.users.get(user_id)
+        data['is_admin'] = user_id is not None and user_id == self.admin_id
+        data['is_banned'] = self.database.bans.is_banned(user_id)
+        return await handler(event, data)
+
+
+# Флаг обработчика -> (условие доступа, ответ по умолчанию)
+ACCESS_RULES = {
+    'admin': (lambda data: data['is_admin'], "❌ Эта команда только для администраторов"),
+    'registered': (lambda data: data['user'] is not None, "❌ Вы не зарегистрированы!"),
+    'not_banned': (lambda data: not data['is_banned'], "⛔ Вы заблокированы"),
+}
+
+
+class AccessMiddleware(BaseMiddleware):
+    """Внутренний middleware: права доступа задаются флагами обработчика
+
+    @router.message(Command("ban"), flags={'admin': True}) — только администратор.
+    Вместо True можно указать текст отказа:
+    flags={'not_banned': "⛔ Вы заблокированы и не можете ставить лайки"}.
+    """
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        for flag, (allowed, default_text) in ACCESS_RULES.items():
+            value = get_flag(data, flag)
+            if value and not allowed(data):
+                text = value if isinstance(value, str) else default_text
+                if isinstance(event, CallbackQuery):
+                    await event.answer(text, show_alert=True)
+                else:
+                    await event.answer(text)
+                return None
+        return await handler(event, data)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Внешний middleware: ограничивает частоту команд каждого пользователя
+
+    Token bucket на пару (пользователь, команда): limits[команда] = (count, period)
+    разрешает всплеск до count запросов и в среднем count запросов за period секунд.
+    Команда кнопки — начало callback_data до '_' (posts_5 считается как /posts);
+    команды без своего лимита и обычные сообщения делят общий лимит 'default'.
+    Администратор не ограничивается.
+    """
+
+    def __init__(self, limits, cleanup_interval=300):
+        self.limits = limits
+        self.cleanup_interval = cleanup_interval
+        self.buckets = {}               # (user_id, команда) -> [токены, время пополнения, предупреждён]
+
+    @staticmethod
+    def command(event: TelegramObject) -> str:
+        if isinstance(event, CallbackQuery):
+            return (event.data or '').split('_', 1)[0]
+        text = getattr(event, 'text', None) or ''
+        if text.startswith('/'):
+            return text.split()[0][1:].split('@')[0].lower()
+        return 'default'
+
+    def consume(self, user_id, command):
+        """Списывает токен; возвращает 0 или сколько секунд ждать следующего"""
+        limit = self.limits.get(command)
+        if not limit:
+            return 0
+        count, period = limit
+        rate = count / period
+        now = time.monotonic()
+        bucket = self.buckets.get((user_id, command))
+        if bucket is None:
+            bucket = self.buckets[(user_id, command)] = [count, now, False]
+        else:
+            bucket[0] = min(count, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return 0
+        return (1 - bucket[0]) / rate
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        from_user = data.get('event_from_user')
+        if from_user is None or data.get('is_admin'):
+            return await handler(event, data)
+
+        command = self.command(event)
+        if command not in self.limits:
+            command = 'default'
+        wait = self.consume(from_user.id, command)
+        if not wait:
+            return await handler(event, data)
+
+        # Предупреждаем один раз, дальше молча пропускаем — иначе спамит уже бот
+        bucket = self.buckets[(from_user.id, command)]
+        if not bucket[2]:
+            bucket[2] = True
+            text = f"🐢 Слишком часто! Попробуйте снова через {math.ceil(wait)} с."
+            if isinstance(event, CallbackQuery):
+                await event.answer(text, show_alert=True)
+            else:
+                await event.answer(text)
+        elif isinstance(event, CallbackQuery):
+            await event.answer()
+        return None
+
+    def cleanup(self):
+        """Забывает счётчики, которые успели пополниться полностью"""
+        now = time.monotonic()
+        for key in [key for key, bucket in self.buckets.items()
+                    if now - bucket[1] >= self.limits[key[1]][1]]:
+            del self.buckets[key]
+
+    async def run_cleanup(self):
+        """Фоновая задача: периодически чистит счётчики неактивных пользователей"""
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            self.cleanup()
@@ -0,0 +1,44 @@
+"""Перенос данных из users_db.json и complaints.json в SQLite
+
+Использование:
+    python migrate.py [--force]
+
+Пути к файлам берутся из config.py. После переноса укажите
+STORAGE_BACKEND = 'sqlite' в config.py.
+"""
+import os
+import sys
+from config import DB_FILE, JOURNAL_FILE, COMPLAINTS_FILE, SQLITE_FILE
+from database import Database
+from schemas import upgrade_db
+from storage import JsonStorage, SqliteStorage
+
+
+def migrate(force=False):
+    if not os.path.exists(DB_FILE):
+        print(f"❌ Файл {DB_FILE} не найден")
+        return 1
+
+    target = SqliteStorage(SQLITE_FILE)
+    if target.load() is not None and not force:
+        print(f"❌ {SQLITE_FILE} уже содержит данные. Для перезаписи запустите с --force")
+        target.close()
+        return 1
+
+    # Загружаем снимок вместе с непримёнными записями журнала
+    source = JsonStorage(DB_FILE, JOURNAL_FILE, COMPLAINTS_FILE)
+    database = Database(source, factory=dict, upgrade=upgrade_db)
+    db = database.load()
+    complaints = database.complaints.items
+    source.close()
+
+    target.save(db, complaints)
+    target.close()
+
+    print(f"✅ Перенесено: пользователей {len(db['approved'])} (+{len(db['pending'])} заявок), "
+          f"постов {len(db['posts'])}, жалоб {len(complaints)} → {SQLITE_FILE}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(migrate(force='--force' in sys.argv[1:]))
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Timings:
+    """Счётчики длительности операций: количество, сумма и максимум"""
+
+    def __init__(self):
+        self.stats = {}                 # имя -> [количество, сумма, максимум]
+
+    def add(self, name, seconds):
+        stat = self.stats.setdefault(name, [0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2] = max(stat[2], seconds)
+
+    def report(self):
+        lines = []
+        for name, (count, total, longest) in sorted(self.stats.items()):
+            lines.append(f"{name}: {count} раз, в среднем {total / count * 1000:.1f} мс, максимум {longest * 1000:.1f} мс")
+        return '\n'.join(lines)
+
+
+class DiskIO:
+    """Поток записи на диск: операции выполняются по очереди вне event loop
+
+    Длительность каждой операции (вместе с ожиданием очереди) попадает в timings.
+    """
+
+    def __init__(self, name='disk-io'):
+        self.timings = Timings()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    async def run(self, name, func, *args):
+        start = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.timings.add(name, time.monotonic() - start)
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+class LoopMonitor:
+    """Измеряет, насколько event loop опаздывает с пробуждением
+
+    Задача засыпает на interval секунд; всё, что сверх этого, — время,
+    когда цикл был занят синхронным кодом и не обрабатывал обновления.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.timings = Timings()
+
+    async def run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.timings.add('блокировка event loop', max(0.0, time.monotonic() - start - self.interval))
+
+    def report(self):
+        return self.timings.report()
@@ -0,0 +1,63 @@
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime, timedelta
+
+
+class Ranking:
+    """Рейтинг постов (лайки − дизлайки), обновляемый при каждой реакции
+
+    Посты хранятся в отсортированном списке, поэтому топ-k читается за O(k).
+    Если задано окно (window), в рейтинге остаются только посты, созданные
+    не раньше now - window: они вытесняются по мере устаревания.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self._order = []                # отсортированные пары (-рейтинг, post_id)
+        self._scores = {}               # post_id -> рейтинг
+        self._added = deque()           # (created_at, post_id) в порядке создания
+        self.version = 0                # меняется при каждом изменении рейтинга
+
+    def add(self, post_id, score, created_at=None):
+        if self.window is not None:
+            if created_at is None:
+                return
+            self._added.append((created_at, post_id))
+        self._scores[post_id] = score
+        insort(self._order, (-score, post_id))
+        self.version += 1
+
+    def update(self, post_id, score):
+        old = self._scores.get(post_id)
+        if old is None or old == score:
+            return
+        self._remove(post_id, old)
+        self._scores[post_id] = score
+        insort(self._order, (-score, post_id))
+        self.version += 1
+
+    def _remove(self, post_id, score):
+        index = bisect_left(self._order, (-score, post_id))
+        del self._order[index]
+
+    def expire(self, now=None):
+        """Убирает посты, вышедшие за окно"""
+        if self.window is None:
+            return
+        cutoff = (now or datetime.now()) - self.window
+        while self._added and self._added[0][0] < cutoff:
+            _, post_id = self._added.popleft()
+            self._remove(post_id, self._scores.pop(post_id))
+            self.version += 1
+
+    def top(self, k, now=None):
+        """Список (post_id, рейтинг) лучших k постов"""
+        self.expire(now)
+        return [(post_id, -score) for score, post_id in self._order[:k]]
+
+
+RANKING_PERIODS = {
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'all': None,
+}
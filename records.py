@@ -0,0 +1,210 @@
+"""Записи базы в памяти: пользователь, пост, комментарий
+
+Вместо словарей — классы со __slots__: даты хранятся как datetime (строка
+разбирается один раз, при загрузке или изменении), а пост и комментарий
+ссылаются на запись автора вместо копии его имени. Комментарии хранятся
+отдельно от постов (db['comments'], см. comments.py). На диске формат прежний:
+to_dict() и from_dict() переводят записи в словари и обратно.
+
+Обработчики обращаются к записям как к словарям (user['first_name'],
+post.get('dislikes', 0)), поэтому переход на классы их не затронул.
+"""
+import logging
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_time(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(value, TIME_FORMAT)
+    except ValueError:
+        logging.warning(f"Некорректная дата в базе: {value!r}")
+        return None
+
+
+def format_time(value):
+    return value.strftime(TIME_FORMAT) if value is not None else None
+
+
+class Record:
+    """Доступ к полям записи по ключам словаря; неизвестные ключи — в extra"""
+    __slots__ = ()
+
+    KEYS = {}               # ключ на диске -> атрибут, если они различаются
+    TIME_FIELDS = ()        # поля с датой: строки из журнала разбираются при записи
+    ATTRS = frozenset()     # атрибуты, доступные по ключу (заполняется ниже)
+
+    def __getitem__(self, key):
+        name = self.KEYS.get(key, key)
+        if name in self.ATTRS:
+            return getattr(self, name)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        name = self.KEYS.get(key, key)
+        if name in self.TIME_FIELDS:
+            value = parse_time(value)
+        if name in self.ATTRS:
+            setattr(self, name, value)
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return self.KEYS.get(key, key) in self.ATTRS or key in self.extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, values):
+        for key, value in values.items():
+            self[key] = value
+
+
+@dataclass(slots=True, eq=False)
+class User(Record):
+    KEYS = {'class': 'class_'}
+    TIME_FIELDS = ('banned_until',)
+
+    user_id: int
+    account_code: str
+    last_name: str
+    first_name: str
+    middle_name: str = ''
+    class_: str = ''
+    username: str = None
+    bio: str = ''
+    posts: list = field(default_factory=list)
+    is_admin: bool = False
+    banned_until: datetime = None
+    extra: dict = field(default_factory=dict)
+
+    @property
+    def display_name(self):
+        return f"{self.last_name} {self.first_name}"
+
+    @classmethod
+    def from_dict(cls, data):
+        user = cls(data['user_id'], data['account_code'], data['last_name'], data['first_name'])
+        for key, value in data.items():
+            user[key] = value
+        return user
+
+    def to_dict(self):
+        data = {
+            'user_id': self.user_id,
+            'account_code': self.account_code,
+            'last_name': self.last_name,
+            'first_name': self.first_name,
+            'middle_name': self.middle_name,
+            'class': self.class_,
+            'username': self.username,
+            'bio': self.bio,
+            'posts': list(self.posts),
+            'is_admin': self.is_admin,
+            'banned_until': format_time(self.banned_until),
+        }
+        data.update(self.extra)
+        return data
+
+
+@dataclass(slots=True, eq=False)
+class Comment(Record):
+    TIME_FIELDS = ('created_at',)
+
+    author_id: int
+    author: User = None         # запись автора; None — автора нет в базе
+    author_label: str = None    # имя автора, если записи автора нет
+    post_id: int = None
+    text: str = None
+    created_at: datetime = None
+    extra: dict = field(default_factory=dict)
+
+    @property
+    def author_name(self):
+        return self.author.display_name if self.author is not None else self.author_label
+
+    @classmethod
+    def from_dict(cls, data, get_user):
+        """get_user(user_id) — запись автора или None"""
+        author = get_user(data['author_id'])
+        comment = cls(data['author_id'], author, None if author else data.get('author_name'))
+        for key, value in data.items():
+            if key not in ('author_id', 'author_name'):
+                comment[key] = value
+        return comment
+
+    def to_dict(self):
+        data = {
+            'post_id': self.post_id,
+            'author_id': self.author_id,
+            'author_name': self.author_name,
+            'text': self.text,
+            'created_at': format_time(self.created_at),
+        }
+        data.update(self.extra)
+        return data
+
+
+@dataclass(slots=True, eq=False)
+class Post(Record):
+    TIME_FIELDS = ('created_at',)
+
+    id: int
+    author_id: int
+    author: User = None
+    author_label: str = None
+    text: str = None
+    likes: int = 0
+    dislikes: int = 0
+    created_at: datetime = None
+    extra: dict = field(default_factory=dict)
+
+    author_name = Comment.author_name
+
+    @classmethod
+    def from_dict(cls, data, get_user):
+        author = get_user(data['author_id'])
+        post = cls(data['id'], data['author_id'], author, None if author else data.get('author_name'))
+        for key, value in data.items():
+            if key not in ('id', 'author_id', 'author_name'):
+                post[key] = value
+        return post
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'author_id': self.author_id,
+            'author_name': self.author_name,
+            'text': self.text,
+            'likes': self.likes,
+            'dislikes': self.dislikes,
+            'created_at': format_time(self.created_at),
+        }
+        data.update(self.extra)
+        return data
+
+
+User.ATTRS = frozenset(f.name for f in fields(User)) - {'extra'}
+Comment.ATTRS = frozenset(f.name for f in fields(Comment)) - {'extra'} | {'author_name'}
+Post.ATTRS = frozenset(f.name for f in fields(Post)) - {'extra'} | {'author_name'}
+
+
+def to_plain(value):
+    """Копия базы из словарей и списков — в том виде, в каком она хранится на диске"""
+    if hasattr(value, 'to_dict'):
+        # Записи и индексы (например, поисковый) хранятся в виде словарей
+        return to_plain(value.to_dict())
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_plain(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return set(value)
+    return value
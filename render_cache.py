@@ -0,0 +1,39 @@
+from collections import OrderedDict
+
+
+class RenderCache:
+    """Готовые ответы бота (текст и клавиатура) по виду и версии данных
+
+    Вид — ключ ответа, например ('post', 5) или ('top', 'day'). Вместе с ответом
+    хранится версия данных, из которых он построен (Database.versions): изменения
+    базы увеличивают версии, поэтому устаревший ответ не совпадает по версии и
+    строится заново. Давно не запрошенные виды вытесняются (LRU).
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()    # вид -> (версия, ответ), недавние в конце
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, view, version, render):
+        """Ответ для вида: из кэша, если версия та же, иначе render()"""
+        entry = self.entries.get(view)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(view)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        value = render()
+        self.entries[view] = (version, value)
+        self.entries.move_to_end(view)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+    def report(self):
+        total = self.hits + self.misses
+        if not total:
+            return None
+        return f"{len(self.entries)} ответов, попаданий {self.hits} из {total} ({self.hits * 100 // total}%)"
@@ -0,0 +1,123 @@
+"""Схемы записей базы: пользователь, пост, комментарий, жалоба
+
+Схема проверяет типы полей и заполняет отсутствующие значениями по
+умолчанию — так старые записи из файла получают поля, добавленные позже.
+Лишние поля сохраняются как есть.
+"""
+from config import ADMIN_ID
+
+REQUIRED = object()
+OPTIONAL = object()     # поле может отсутствовать (например, id поста до публикации)
+NoneType = type(None)
+
+
+class SchemaError(ValueError):
+    pass
+
+
+class Field:
+    def __init__(self, *types, default=REQUIRED, factory=None):
+        self.types = types
+        self.default = default
+        self.factory = factory      # factory(record) — значение по умолчанию, зависящее от записи
+
+
+class Schema:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def decode(self, record):
+        """Проверяет запись и дополняет её значениями по умолчанию (на месте)"""
+        if not isinstance(record, dict):
+            raise SchemaError(f"{self.name}: ожидался объект, получено {type(record).__name__}")
+        for name, field in self.fields.items():
+            if name not in record:
+                if field.factory is not None:
+                    record[name] = field.factory(record)
+                elif field.default is OPTIONAL:
+                    continue
+                elif field.default is REQUIRED:
+                    raise SchemaError(f"{self.name}: нет поля {name!r}")
+                else:
+                    record[name] = field.default
+            if not isinstance(record[name], field.types):
+                raise SchemaError(f"{self.name}: поле {name!r} имеет тип {type(record[name]).__name__}")
+        return record
+
+    def build(self, values):
+        """Новая запись из значений, собранных обработчиком"""
+        return self.decode(dict(values))
+
+
+USER = Schema('user', {
+    'user_id': Field(int),
+    'account_code': Field(str),
+    'last_name': Field(str),
+    'first_name': Field(str),
+    'middle_name': Field(str, NoneType, default=''),
+    'class': Field(str, NoneType, default=''),
+    'username': Field(str, NoneType, default=None),
+    'bio': Field(str, NoneType, default=''),
+    'posts': Field(list, factory=lambda user: []),
+    'is_admin': Field(bool, factory=lambda user: user.get('user_id') == ADMIN_ID),
+    'banned_until': Field(str, NoneType, default=None),
+})
+
+COMMENT = Schema('comment', {
+    'post_id': Field(int, default=OPTIONAL),    # назначается базой при добавлении
+    'author_id': Field(int),
+    'author_name': Field(str),
+    'text': Field(str, NoneType, default=None),
+    'created_at': Field(str, NoneType, default=None),
+})
+
+POST = Schema('post', {
+    'id': Field(int, default=OPTIONAL),     # назначается базой при публикации
+    'author_id': Field(int),
+    'author_name': Field(str),
+    'text': Field(str, NoneType, default=None),
+    'likes': Field(int, default=0),
+    'dislikes': Field(int, default=0),
+    'created_at': Field(str, NoneType, default=None),
+})
+
+COMPLAINT = Schema('complaint', {
+    'id': Field(int, default=OPTIONAL),     # назначается базой при добавлении
+    'timestamp': Field(str),
+    'target_id': Field(int),
+    'target_name': Field(str),
+    'target_code': Field(str),
+    'complainant_id': Field(int),
+    'complainant_name': Field(str),
+    'reason': Field(str, default=''),
+    'status': Field(str, default='new'),
+})
+
+
+def decode_db(db):
+    """Проверяет все записи загруженной базы по схемам"""
+    for user in db['pending'] + db['approved']:
+        USER.decode(user)
+    for post in db['posts']:
+        POST.decode(post)
+        # Старый формат: комментарии внутри поста (переносятся при загрузке базы)
+        for comment in post.get('comments', ()):
+            COMMENT.decode(comment)
+    for comment in db.setdefault('comments', []):
+        COMMENT.decode(comment)
+    return db
+
+
+def upgrade_db(db):
+    """Приводит базу старого формата к текущему (при загрузке и при переносе в SQLite)"""
+    # Списки проголосовавших переехали из постов в db['reactions']
+    reactions = db.setdefault('reactions', {})
+    for post in db['posts']:
+        for field, section in (('liked_by', 'likes'), ('disliked_by', 'dislikes')):
+            voters = post.pop(field, None)
+            if voters:
+                reactions.setdefault(section, {})[str(post['id'])] = voters
+
+    # Отсутствующие поля заполняются по схемам записей
+    decode_db(db)
@@ -0,0 +1,131 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+WORD_RE = re.compile(r"[а-яёa-z0-9]+")
+
+STOP_WORDS = frozenset("""
+    а без бы в во вот вы да для до же за и из или к как ко ли мы на не нет ни но
+    о об он она они оно от по при с со так то ты у что это я
+""".split())
+
+# Окончания, которые отрезает лёгкий стеммер (сначала длинные)
+ENDINGS = sorted(set("""
+    иями ями ами иях ях ах ией ием ией иям ям ам ов ев ей ой ий ый ие ые ое ая яя ую юю
+    ого его ому ему ими ыми ем им ым ом их ых ею ою ешь ете ишь ите ет ит ут ют ат ят
+    ла ло ли ть ти ия ья ью ию а е и о у ы ь ю я й
+""".split()), key=len, reverse=True)
+MIN_STEM = 3
+
+# Вес слова из текста поста и из комментария к нему
+POST_WEIGHT = 2
+COMMENT_WEIGHT = 1
+
+# Параметры BM25
+K1 = 1.2
+B = 0.75
+
+
+def stem(word):
+    """Лёгкий стемминг: отрезает возвратную частицу и одно окончание"""
+    if not word.isalpha() or not 'а' <= word[0] <= 'я':
+        return word
+    for suffix in ('ся', 'сь'):
+        if word.endswith(suffix) and len(word) - 2 >= MIN_STEM:
+            word = word[:-2]
+            break
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    """Основы слов текста без стоп-слов"""
+    words = WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+    return [stem(word) for word in words if word not in STOP_WORDS]
+
+
+class SearchIndex:
+    """Обратный индекс по текстам постов и комментариев к ним
+
+    Документ — пост вместе с комментариями: слово -> {post_id: вес}, где вес —
+    число вхождений (в тексте поста с весом POST_WEIGHT). Индекс пополняется при
+    каждом посте и комментарии, а запрос читает только списки своих слов, так что
+    его скорость не зависит от числа постов. Результаты упорядочены по BM25.
+
+    Индекс хранится в снимке базы (db['search']). Посты и комментарии, которых
+    в сохранённом индексе ещё нет, добавляются при загрузке (catch_up).
+    """
+    VERSION = 1     # меняется вместе с токенизатором: старый индекс строится заново
+
+    def __init__(self):
+        self.postings = defaultdict(dict)   # основа -> {post_id: вес}
+        self.lengths = {}                   # post_id -> суммарный вес слов документа
+        self.total_length = 0
+        self.posts = 0                      # проиндексировано постов
+        self.comments = 0                   # проиндексировано комментариев
+
+    def _add_text(self, post_id, text, weight):
+        for term, count in Counter(tokenize(text)).items():
+            postings = self.postings[term]
+            postings[post_id] = postings.get(post_id, 0) + count * weight
+            self.lengths[post_id] = self.lengths.get(post_id, 0) + count * weight
+            self.total_length += count * weight
+
+    def add_post(self, post):
+        self._add_text(post.id, post.text, POST_WEIGHT)
+        self.posts += 1
+
+    def add_comment(self, comment):
+        self._add_text(comment.post_id, comment.text, COMMENT_WEIGHT)
+        self.comments += 1
+
+    def catch_up(self, posts, comments):
+        """Добавляет посты и комментарии, появившиеся после сохранения индекса"""
+        for post in posts[self.posts:]:
+            self.add_post(post)
+        for comment in comments[self.comments:]:
+            self.add_comment(comment)
+
+    def search(self, query):
+        """Номера постов, подходящих под запрос, с оценкой: [(post_id, оценка)], лучшие первыми"""
+        if not self.lengths:
+            return []
+        total = len(self.lengths)
+        average = self.total_length / total
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for post_id, weight in postings.items():
+                norm = K1 * (1 - B + B * self.lengths[post_id] / average)
+                scores[post_id] += idf * weight * (K1 + 1) / (weight + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+    def to_dict(self):
+        return {
+            'version': self.VERSION,
+            'posts': self.posts,
+            'comments': self.comments,
+            'postings': {term: dict(postings) for term, postings in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Индекс из снимка; пустой, если его нет или он построен другой версией"""
+        index = cls()
+        if not data or data.get('version') != cls.VERSION:
+            return index
+        index.posts = data['posts']
+        index.comments = data['comments']
+        for term, postings in data['postings'].items():
+            # Ключи JSON — строки
+            postings = {int(post_id): weight for post_id, weight in postings.items()}
+            index.postings[term] = postings
+            for post_id, weight in postings.items():
+                index.lengths[post_id] = index.lengths.get(post_id, 0) + weight
+                index.total_length += weight
+        return index
@@ -0,0 +1,401 @@
+import json
+import logging
+import os
+import sqlite3
+from codec import get_codec
+from records import to_plain
+
+
+class CorruptDatabaseError(Exception):
+    """Файл базы повреждён — запускаться с пустой базой поверх него нельзя"""
+
+
+def _write_atomic(path, text):
+    """Записывает файл целиком: при сбое на диске остаётся старая или новая версия"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    # Переименование тоже должно дойти до диска
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class JsonStorage:
+    """Хранилище в JSON: снимок базы + журнал изменений (JSONL) + файл жалоб"""
+
+    def __init__(self, path, journal_path, complaints_path, compact_every=500, compact_json=False, codec=None):
+        self.path = path
+        self.journal_path = journal_path
+        self.complaints_path = complaints_path
+        self.compact_every = compact_every
+        self.compact_json = compact_json    # снимок без отступов: меньше и быстрее
+        self.codec = codec or get_codec()
+        self.journal_size = 0           # записей в журнале после последнего снимка
+        self._journal = None
+
+    def load(self):
+        """Читает снимок базы, None — если базы ещё нет"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return self.codec.loads(f.read())
+        except json.JSONDecodeError as e:
+            # Пустая база поверх повреждённой стёрла бы все данные
+            raise CorruptDatabaseError(
+                f"Файл базы {self.path} повреждён ({e}). Восстановите его из резервной копии "
+                f"или удалите, чтобы начать с пустой базы"
+            ) from e
+
+    def replay(self, after_seq):
+        """Возвращает записи журнала, которых ещё нет в снимке"""
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = self.codec.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная при сбое последняя запись
+                    logging.warning("Пропущена повреждённая запись журнала")
+                    break
+                if record['seq'] > after_seq:
+                    yield record
+
+    def append(self, records):
+        """Дописывает операции транзакции в журнал одной записью на диск"""
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal.write(''.join(
+            self.codec.dumps(record) + '\n'
+            for record in records
+        ))
+        self._journal.flush()
+        # Транзакции ждут, пока их операции дойдут до диска: один fsync на пачку
+        os.fsync(self._journal.fileno())
+        self.journal_size += len(records)
+
+    def needs_snapshot(self):
+        return self.journal_size >= self.compact_every
+
+    def encode_snapshot(self, data, complaints):
+        return (self.codec.dumps(data, indent=not self.compact_json),
+                self.codec.dumps(complaints, indent=not self.compact_json))
+
+    def save(self, data, complaints):
+        self.write_snapshot(self.encode_snapshot(data, complaints))
+
+    def write_snapshot(self, snapshot):
+        """Записывает снимок базы и жалоб и очищает журнал"""
+        data, complaints = snapshot
+        # Если сбой случится между файлами, повторное применение журнала
+        # пропустит жалобы, которые уже есть в complaints.json
+        _write_atomic(self.complaints_path, complaints)
+        _write_atomic(self.path, data)
+
+        # Всё из журнала уже в снимке, и снимок уже на диске
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, 'w', encoding='utf-8')
+        self.journal_size = 0
+
+    def load_complaints(self):
+        if not os.path.exists(self.complaints_path):
+            return []
+        with open(self.complaints_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        # Пустой файл — жалоб ещё не было
+        return self.codec.loads(content) if content.strip() else []
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+# Код аккаунта не уникален: старые версии бота не проверяли повторы,
+# а INSERT OR REPLACE молча удалил бы пользователя с тем же кодом
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    account_code TEXT NOT NULL,
+    status TEXT NOT NULL,
+    ord INTEGER NOT NULL,
+    last_name TEXT,
+    first_name TEXT,
+    middle_name TEXT,
+    "class" TEXT,
+    username TEXT,
+    bio TEXT,
+    is_admin INTEGER NOT NULL DEFAULT 0,
+    banned_until TEXT
+);
+CREATE INDEX IF NOT EXISTS users_code ON users(account_code);
+CREATE INDEX IF NOT EXISTS users_username ON users(username);
+CREATE INDEX IF NOT EXISTS users_status ON users(status, ord);
+
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    author_id INTEGER NOT NULL,
+    author_name TEXT,
+    text TEXT,
+    likes INTEGER NOT NULL DEFAULT 0,
+    dislikes INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS posts_author ON posts(author_id);
+
+CREATE TABLE IF NOT EXISTS reactions (
+    post_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    PRIMARY KEY (post_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS reactions_user ON reactions(user_id);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL,
+    author_id INTEGER,
+    author_name TEXT,
+    text TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_post ON comments(post_id, id);
+
+CREATE TABLE IF NOT EXISTS complaints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    target_id INTEGER,
+    target_name TEXT,
+    target_code TEXT,
+    complainant_id INTEGER,
+    complainant_name TEXT,
+    reason TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS complaints_target ON complaints(target_id);
+CREATE INDEX IF NOT EXISTS complaints_complainant ON complaints(complainant_id);
+CREATE INDEX IF NOT EXISTS complaints_status ON complaints(status);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+USER_FIELDS = ('user_id', 'account_code', 'last_name', 'first_name', 'middle_name',
+               'class', 'username', 'bio', 'is_admin', 'banned_until')
+POST_FIELDS = ('id', 'author_id', 'author_name', 'text', 'likes', 'dislikes', 'created_at')
+COMMENT_FIELDS = ('author_id', 'author_name', 'text', 'created_at')
+COMPLAINT_FIELDS = ('timestamp', 'target_id', 'target_name', 'target_code',
+                    'complainant_id', 'complainant_name', 'reason', 'status')
+TABLE_SECTIONS = ('pending', 'approved', 'posts', 'comments', 'reactions')
+REACTION_COUNTERS = {'like': 'likes', 'dislike': 'dislikes'}
+REACTION_KINDS = {section: kind for kind, section in REACTION_COUNTERS.items()}
+
+
+def _columns(fields):
+    return ', '.join(f'"{field}"' for field in fields)
+
+def _placeholders(fields):
+    return ', '.join('?' for _ in fields)
+
+
+class SqliteStorage:
+    """Хранилище в SQLite: таблицы с индексами, изменения применяются по одной транзакции"""
+
+    def __init__(self, path, codec=None):
+        self.path = path
+        self.codec = codec or get_codec()
+        # Соединение используется из потока записи базы (по одному запросу за раз)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'journal_seq'").fetchone()
+        self.applied_seq = self.codec.loads(row['value']) if row else 0  # последняя применённая операция
+
+    def load(self):
+        """Собирает базу из таблиц, None — если база пустая"""
+        meta = {row['key']: self.codec.loads(row['value']) for row in self.conn.execute("SELECT key, value FROM meta")}
+        if not meta:
+            return None
+
+        data = dict(meta)
+        data['pending'] = []
+        data['approved'] = []
+        for row in self.conn.execute(f"SELECT status, {_columns(USER_FIELDS)} FROM users ORDER BY ord"):
+            user = {field: row[field] for field in USER_FIELDS}
+            user['is_admin'] = bool(user['is_admin'])
+            user['posts'] = []
+            data[row['status']].append(user)
+
+        data['posts'] = [
+            {field: row[field] for field in POST_FIELDS}
+            for row in self.conn.execute(f"SELECT {_columns(POST_FIELDS)} FROM posts ORDER BY id")
+        ]
+
+        data['reactions'] = {section: {} for section in REACTION_KINDS}
+        for row in self.conn.execute("SELECT post_id, user_id, kind FROM reactions"):
+            section = data['reactions'][REACTION_COUNTERS[row['kind']]]
+            section.setdefault(row['post_id'], set()).add(row['user_id'])
+        data['comments'] = [
+            {'post_id': row['post_id'], **{field: row[field] for field in COMMENT_FIELDS}}
+            for row in self.conn.execute(f"SELECT post_id, {_columns(COMMENT_FIELDS)} FROM comments ORDER BY id")
+        ]
+        return data
+
+    def replay(self, after_seq):
+        # Операции применяются к таблицам сразу, восстанавливать нечего
+        return iter(())
+
+    def append(self, records):
+        """Применяет операции транзакции к таблицам в одной транзакции SQLite
+
+        Операции, уже попавшие в снимок (например, если снимок записан после
+        ошибки записи раньше них), пропускаются: повторно они не применяются.
+        """
+        records = [record for record in records if record['seq'] > self.applied_seq]
+        if not records:
+            return
+        with self.conn:
+            for record in records:
+                record = dict(record)
+                getattr(self, f"_op_{record.pop('op')}")(**record)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('journal_seq', ?)",
+                (self.codec.dumps(records[-1]['seq']),)
+            )
+        self.applied_seq = records[-1]['seq']
+
+    def needs_snapshot(self):
+        return False
+
+    def encode_snapshot(self, data, complaints):
+        return to_plain(data), [dict(complaint) for complaint in complaints]
+
+    def save(self, data, complaints):
+        self.write_snapshot(self.encode_snapshot(data, complaints))
+
+    def write_snapshot(self, snapshot):
+        """Полностью перезаписывает таблицы базы"""
+        data, complaints = snapshot
+        with self.conn:
+            for table in ('users', 'posts', 'reactions', 'comments', 'complaints', 'meta'):
+                self.conn.execute(f"DELETE FROM {table}")
+
+            for ord_, user in enumerate(data['pending'] + data['approved']):
+                status = 'pending' if ord_ < len(data['pending']) else 'approved'
+                self._insert_user(user, status, ord_)
+
+            for post in data['posts']:
+                self._op_post_add(0, post)
+            for comment in data.get('comments', []):
+                self._op_comment_add(0, comment['post_id'], comment)
+
+            for section, voters_by_post in data.get('reactions', {}).items():
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO reactions (post_id, user_id, kind) VALUES (?, ?, ?)",
+                    [(int(post_id), user_id, REACTION_KINDS[section])
+                     for post_id, voters in voters_by_post.items() for user_id in voters]
+                )
+
+            self.conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                [(key, self.codec.dumps(value))
+                 for key, value in data.items() if key not in TABLE_SECTIONS]
+            )
+            self._insert_complaints(complaints)
+        self.applied_seq = data.get('journal_seq', 0)
+
+    def _insert_user(self, user, status, ord_):
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO users (status, ord, {_columns(USER_FIELDS)}) "
+            f"VALUES (?, ?, {_placeholders(USER_FIELDS)})",
+            (status, ord_, *(user.get(field) for field in USER_FIELDS))
+        )
+
+    def _op_post_add(self, seq, post):
+        self.conn.execute(
+            f"INSERT INTO posts ({_columns(POST_FIELDS)}) VALUES ({_placeholders(POST_FIELDS)})",
+            tuple(post.get(field) for field in POST_FIELDS)
+        )
+
+    def _op_reaction(self, seq, post_id, user_id, kind):
+        row = self.conn.execute(
+            "SELECT kind FROM reactions WHERE post_id = ? AND user_id = ?", (post_id, user_id)
+        ).fetchone()
+        if row and row['kind'] == kind:
+            return
+        if row:
+            counter = REACTION_COUNTERS[row['kind']]
+            self.conn.execute(f"UPDATE posts SET {counter} = {counter} - 1 WHERE id = ?", (post_id,))
+
+        counter = REACTION_COUNTERS[kind]
+        self.conn.execute(f"UPDATE posts SET {counter} = {counter} + 1 WHERE id = ?", (post_id,))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO reactions (post_id, user_id, kind) VALUES (?, ?, ?)",
+            (post_id, user_id, kind)
+        )
+
+    def _op_comment_add(self, seq, post_id, comment):
+        self.conn.execute(
+            f"INSERT INTO comments (post_id, {_columns(COMMENT_FIELDS)}) "
+            f"VALUES (?, {_placeholders(COMMENT_FIELDS)})",
+            (post_id, *(comment.get(field) for field in COMMENT_FIELDS))
+        )
+
+    def _op_user_register(self, seq, user):
+        self._insert_user(user, 'pending', seq)
+
+    def _op_user_approve(self, seq, user_id):
+        self.conn.execute(
+            "UPDATE users SET status = 'approved', ord = ? WHERE user_id = ? AND status = 'pending'",
+            (seq, user_id)
+        )
+
+    def _op_user_reject(self, seq, user_id):
+        self.conn.execute("DELETE FROM users WHERE user_id = ? AND status = 'pending'", (user_id,))
+
+    def _op_user_update(self, seq, user_id, fields):
+        fields = {field: value for field, value in fields.items() if field in USER_FIELDS}
+        if not fields:
+            return
+        assignments = ', '.join(f'"{field}" = ?' for field in fields)
+        self.conn.execute(
+            f"UPDATE users SET {assignments} WHERE user_id = ? AND status = 'approved'",
+            (*fields.values(), user_id)
+        )
+
+    def load_complaints(self):
+        rows = self.conn.execute(f"SELECT id, {_columns(COMPLAINT_FIELDS)} FROM complaints ORDER BY id")
+        return [{'id': row['id'], **{field: row[field] for field in COMPLAINT_FIELDS}} for row in rows]
+
+    def _insert_complaints(self, complaints):
+        self.conn.executemany(
+            f"INSERT OR IGNORE INTO complaints (id, {_columns(COMPLAINT_FIELDS)}) "
+            f"VALUES (?, {_placeholders(COMPLAINT_FIELDS)})",
+            [(complaint.get('id'), *(complaint.get(field) for field in COMPLAINT_FIELDS)) for complaint in complaints]
+        )
+
+    def _op_complaint_add(self, seq, complaint):
+        self._insert_complaints([complaint])
+
+    def _op_complaint_status(self, seq, complaint_ids, status):
+        self.conn.executemany(
+            "UPDATE complaints SET status = ? WHERE id = ?",
+            [(status, complaint_id) for complaint_id in complaint_ids]
+        )
+
+    def close(self):
+        self.conn.close()
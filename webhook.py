@@ -0,0 +1,77 @@
+import asyncio
+import hmac
+import logging
+from aiohttp import web
+from aiogram.types import Update
+from pydantic import ValidationError
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def create_app(dp, bot, path, secret):
+    """aiohttp-приложение: POST path принимает обновления, GET /health — проверка живости"""
+    if not secret:
+        # Отправитель берётся из тела обновления: без секрета любой мог бы выдать себя за админа
+        raise ValueError("Для вебхука нужен секрет (WEBHOOK_SECRET в config.py)")
+    tasks = set()
+
+    async def handle_update(request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+
+        # Отвечаем Telegram сразу, обработка идёт в фоне
+        task = asyncio.create_task(dp.feed_update(bot, update))
+        tasks.add(task)
+        task.add_done_callback(update_done)
+        return web.Response()
+
+    def update_done(task):
+        tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Ошибка обработки обновления: {task.exception()!r}")
+
+    async def finish_updates(app):
+        # При остановке дожидаемся обработки принятых обновлений: после
+        # возврата из run_webhook база и хранилище FSM закрываются
+        if tasks:
+            logging.info(f"Ожидаем обработки {len(tasks)} обновлений")
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def health(request):
+        return web.json_response({'status': 'ok', 'pending_updates': len(tasks)})
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get('/health', health)
+    app.on_shutdown.append(finish_updates)
+    return app
+
+
+async def run_webhook(dp, bot, host, port, path, secret, url=None, stop_event=None):
+    """Запускает сервер вебхука и работает до stop_event
+
+    Обновления принимаются только с заголовком секрета; без секрета сервер не
+    запускается. Если указан url (внешний адрес сервера), вебхук регистрируется
+    в Telegram; без него сервер можно проверять локально, отправляя JSON
+    обновлений на path. При остановке дожидается обработки принятых обновлений.
+    """
+    runner = web.AppRunner(create_app(dp, bot, path, secret))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Вебхук слушает {host}:{port}{path}")
+
+    if url:
+        await bot.set_webhook(
+            f"{url.rstrip('/')}{path}",
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    try:
+        await (stop_event or asyncio.Event()).wait()
+    finally:
+        await runner.cleanup()